@@ -0,0 +1,261 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import scipy
+import sklearn
+
+from random_networks import ErdosRenyiNetwork, WattsStrogatzNetwork, BarabasiAlbertNetwork
+from toolkit import generate_random_variable, pseudoinverse, network_approximation, infomation_divergence, \
+    mutual_infomation, fisher_information, granger_causality_and_transfer_entropy, entropy_estimation
+
+
+def weighted_network(n, density, rng):
+    W = ErdosRenyiNetwork(n, density, seed=rng) * (1 + rng.random((n, n)) * 9)
+    return np.triu(W, 1) + np.triu(W, 1).T
+
+
+def setup_generate_random_variable(n, density, sample_num, rng):
+    W = weighted_network(n, density, rng)
+    return lambda: generate_random_variable(W)
+
+
+def setup_pseudoinverse(n, density, sample_num, rng):
+    L, _, _ = generate_random_variable(weighted_network(n, density, rng))
+    return lambda: pseudoinverse(L)
+
+
+def setup_network_approximation(n, density, sample_num, rng):
+    W_a = weighted_network(n, density, rng)
+    W_b = weighted_network(int(0.6 * n), density, rng)
+    encoded_a = generate_random_variable(W_a)
+    encoded_b = generate_random_variable(W_b)
+    return lambda: network_approximation(W_a, W_b, encoded_a[0], encoded_b[0], encoded_a[1], encoded_b[1],
+                                         encoded_a[2], encoded_b[2])
+
+
+def setup_infomation_divergence(n, density, sample_num, rng):
+    _, _, sigma_a = generate_random_variable(weighted_network(n, density, rng))
+    _, _, sigma_b = generate_random_variable(weighted_network(n, density, rng))
+    return lambda: infomation_divergence(sigma_a, sigma_b)
+
+
+def setup_mutual_infomation(n, density, sample_num, rng):
+    _, _, sigma_a = generate_random_variable(weighted_network(n, density, rng))
+    _, _, sigma_b = generate_random_variable(weighted_network(n, density, rng))
+    return lambda: mutual_infomation(sigma_a, sigma_b, sample_num, 2, seed=0)
+
+
+def setup_fisher_information(n, density, sample_num, rng):
+    W = weighted_network(n, density, rng)
+    sigma_ensemble = np.array([generate_random_variable(W * (1 + 0.1 * i))[2] for i in range(10)])
+    theta_matrix = np.sort(rng.random((10, 10)), axis=0)
+    return lambda: fisher_information(sigma_ensemble, theta_matrix)
+
+
+def setup_granger_causality_and_transfer_entropy(n, density, sample_num, rng):
+    _, _, sigma_a = generate_random_variable(weighted_network(n, density, rng))
+    _, _, sigma_b = generate_random_variable(weighted_network(n, density, rng))
+    return lambda: granger_causality_and_transfer_entropy(sigma_a, sigma_b, sample_num, 2, 2, seed=0)
+
+
+def setup_entropy_estimation(n, density, sample_num, rng):
+    joint_samples = rng.standard_normal((sample_num, n))
+    return lambda: entropy_estimation(joint_samples, 2)
+
+
+def setup_erdos_renyi(n, density, sample_num, rng):
+    return lambda: ErdosRenyiNetwork(n, density, seed=0, output='csr')
+
+
+def setup_watts_strogatz(n, density, sample_num, rng):
+    k = max(1, min(int(density * n / 2), (n - 1) // 2))
+    return lambda: WattsStrogatzNetwork(n, k, 0.5, seed=0, output='csr')
+
+
+def setup_barabasi_albert(n, density, sample_num, rng):
+    m0 = max(2, min(int(density * n / 2), n - 1))
+    return lambda: BarabasiAlbertNetwork(n, m0, seed=0, output='csr')
+
+
+# name: (setup, the largest n run by default, whether sample_num matters)
+BENCHMARKS = {
+    'generate_random_variable': (setup_generate_random_variable, 10000, False),
+    'pseudoinverse': (setup_pseudoinverse, 10000, False),
+    'network_approximation': (setup_network_approximation, 10000, False),
+    'infomation_divergence': (setup_infomation_divergence, 10000, False),
+    'mutual_infomation': (setup_mutual_infomation, 1000, True),
+    'fisher_information': (setup_fisher_information, 3000, False),
+    'granger_causality_and_transfer_entropy': (setup_granger_causality_and_transfer_entropy, 1000, True),
+    'entropy_estimation': (setup_entropy_estimation, 1000, True),
+    'erdos_renyi': (setup_erdos_renyi, 10000, False),
+    'watts_strogatz': (setup_watts_strogatz, 10000, False),
+    'barabasi_albert': (setup_barabasi_albert, 10000, False),
+}
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _measure(name, params, repeat, connection):
+    try:
+        connection.send(_run_case(name, params, repeat))
+    except Exception as e:
+        connection.send({'error': '{}: {}'.format(type(e).__name__, e)})
+    connection.close()
+
+
+def _run_case(name, params, repeat):
+    setup = BENCHMARKS[name][0]
+    func = setup(params['n'], params['density'], params['sample_num'], np.random.default_rng(0))
+    rss_before = _peak_rss_mb()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    rss_after = _peak_rss_mb()
+    # tracing slows allocations down, so it gets a separate, untimed run
+    tracemalloc.start()
+    func()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'time': min(times),
+        'peak_rss_mb': rss_after,
+        'peak_rss_increase_mb': rss_after - rss_before,
+        'traced_peak_mb': traced_peak / 2.0**20,
+    }
+
+
+def measure(name, params, repeat=1, timeout=None):
+    """
+    Run one benchmark case in a fresh process, so that its peak RSS is not
+    polluted by the previous cases.
+
+    Output:
+    a dict with the best wall time over repeat runs in seconds, the peak RSS of the
+    process and its increase during the timed runs in MB, and the peak of the
+    memory traced by tracemalloc (numpy buffers included) during one more run in MB,
+    or a dict with an error if the case raised, was killed (e.g. out of memory) or
+    timed out
+    """
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_measure, args=(name, params, repeat, sender))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv() if receiver.poll(timeout) else {'error': 'timeout'}
+    except EOFError:
+        # the process died without sending a result, a negative exit code is the killing signal
+        process.join()
+        result = {'error': 'exited with code {}'.format(process.exitcode)}
+    process.join(0 if 'error' in result else None)
+    if process.is_alive():
+        process.kill()
+    return result
+
+
+def cases(names, sizes, densities, sample_nums, all_sizes=False):
+    for name in names:
+        _, max_n, uses_samples = BENCHMARKS[name]
+        for n, density, sample_num in itertools.product(sizes, densities, sample_nums if uses_samples else [None]):
+            if all_sizes or n <= max_n:
+                yield name, {'n': n, 'density': density, 'sample_num': sample_num}
+
+
+def case_key(result):
+    return result['benchmark'], json.dumps(result['params'], sort_keys=True)
+
+
+def compare(results, baseline, threshold):
+    """
+    Output:
+    the list of (benchmark, params, quantity, baseline value, new value) whose new
+    value exceeds the baseline value by more than the threshold ratio
+    """
+    reference = {case_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        old = reference.get(case_key(result))
+        if old is None or 'error' in old or 'error' in result:
+            continue
+        for quantity in ('time', 'traced_peak_mb', 'peak_rss_mb'):
+            if result[quantity] > old[quantity] * (1 + threshold):
+                regressions.append((result['benchmark'], result['params'], quantity, old[quantity], result[quantity]))
+    return regressions
+
+
+def write_report(path, report):
+    # replace the file atomically, an interrupted suite keeps the results of its finished cases
+    fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(report, f, indent=1)
+    os.replace(temporary_path, path)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Scaling benchmarks of the toolkit functions')
+    parser.add_argument('--benchmarks', type=str, default=','.join(BENCHMARKS), help='comma-separated benchmarks')
+    parser.add_argument('--sizes', type=str, default='100,300,1000,3000,10000', help='numbers of nodes')
+    parser.add_argument('--densities', type=str, default='0.05,0.2', help='edge densities')
+    parser.add_argument('--sample_nums', type=str, default='1000,5000', help='numbers of samples')
+    parser.add_argument('--repeat', type=int, default=1, help='timed runs per case, the best is kept')
+    parser.add_argument('--timeout', type=float, default=None, help='seconds before a case is abandoned')
+    parser.add_argument('--all_sizes', action='store_true', help='ignore the per-benchmark size limits')
+    parser.add_argument('--output', type=str, default='benchmark.json', help='results file')
+    parser.add_argument('--baseline', type=str, default=None, help='results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative slowdown or memory growth')
+    return parser.parse_args()
+
+
+def main(args):
+    names = args.benchmarks.split(',')
+    for name in names:
+        assert name in BENCHMARKS, 'Unknown benchmark: {}, available: {}'.format(name, sorted(BENCHMARKS))
+    sizes = [int(n) for n in args.sizes.split(',')]
+    densities = [float(density) for density in args.densities.split(',')]
+    sample_nums = [int(sample_num) for sample_num in args.sample_nums.split(',')]
+
+    results = []
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'scipy': scipy.__version__,
+            'sklearn': sklearn.__version__,
+            'platform': platform.platform(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+    # the report is rewritten after every case
+    for name, params in cases(names, sizes, densities, sample_nums, args.all_sizes):
+        result = dict(benchmark=name, params=params, **measure(name, params, args.repeat, args.timeout))
+        results.append(result)
+        write_report(args.output, report)
+        print(json.dumps(result), flush=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for name, params, quantity, old, new in regressions:
+            print('REGRESSION {} {} {}: {:.4g} -> {:.4g}'.format(name, json.dumps(params), quantity, old, new))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(parse_args())
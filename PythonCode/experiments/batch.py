@@ -0,0 +1,304 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import tempfile
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.io import loadmat
+
+from toolkit import EncodedNetwork, infomation_divergence, mutual_infomation, fisher_information, \
+    granger_causality_and_transfer_entropy, network_approximation, iter_sigma_ensemble, \
+    convert_to_symmetric_with_zero_diagonal, ResultCache, memoize
+from toolkit.parallel import imap_unordered
+from toolkit.store import NetworkStore
+from service.cache import EncodedNetworkCache
+
+
+METRICS = ('divergence', 'mi', 'fisher', 'causality')
+# metrics that are symmetric in the two networks are computed once per unordered pair
+SYMMETRIC_METRICS = ('divergence', 'mi')
+FIELDS = ['network_a', 'network_b', 'metric', 'quantity', 'value']
+# the quantities written by a finished job of every metric
+QUANTITIES = {
+    'divergence': ('d_ab', 'd_ba', 'gamma'),
+    'mi': ('h_a', 'h_b', 'h_ab', 'i_ab'),
+    'fisher': ('fisher_trace_mean',),
+    'causality': ('g_ab', 't_ab'),
+}
+
+
+def load_network(path, key=None):
+    """
+    Input:
+    path: a .npz (dense or scipy.sparse), .npy, .mat or edge-list file, where every
+        line of an edge list is 'i j' or 'i j w' with 0-based node indices
+    key: the name of the adjacency matrix in .npz and .mat files, 'W' or the
+        first matrix if None
+
+    Output:
+    W: the weighted adjacent matrix, dense or scipy.sparse
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.npz':
+        with np.load(path, allow_pickle=False) as data:
+            if 'format' in data.files and 'indptr' in data.files:
+                return sp.load_npz(path).tocsr()
+            return data[key or ('W' if 'W' in data.files else data.files[0])]
+    if extension == '.npy':
+        return np.load(path, mmap_mode='r')
+    if extension == '.mat':
+        data = loadmat(path)
+        names = [name for name in data if not name.startswith('__')]
+        W = data[key or ('W' if 'W' in names else names[0])]
+        return W.tocsr() if sp.issparse(W) else W
+    edges = np.atleast_2d(np.loadtxt(path))
+    weights = edges[:, 2] if edges.shape[1] > 2 else np.ones(edges.shape[0])
+    rows, cols = edges[:, 0].astype(int), edges[:, 1].astype(int)
+    n = max(rows.max(), cols.max()) + 1
+    W = sp.coo_matrix((weights, (rows, cols)), shape=(n, n)).tocsr()
+    return (W + W.T - sp.diags(W.diagonal())).tocsr()
+
+
+def read_manifest(path):
+    """
+    Input:
+    path: a .json file with a list of {"name": ..., "path": ..., "key": ...} entries,
+        or a text file with one 'path' or 'name path' per line, relative paths being
+        relative to the manifest; a path that is a NetworkStore directory refers to
+        the network called name in that store
+
+    Output:
+    networks: a list of {"name", "path", "key"} dicts
+    """
+    root = os.path.dirname(os.path.abspath(path))
+    if path.endswith('.json'):
+        with open(path) as f:
+            entries = json.load(f)
+    else:
+        entries = []
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if fields and not fields[0].startswith('#'):
+                    entries.append({'name': fields[0], 'path': fields[-1]})
+    networks = []
+    for entry in entries:
+        network_path = os.path.join(root, entry['path'])
+        name = entry.get('name') or os.path.splitext(os.path.basename(network_path))[0]
+        networks.append({'name': name, 'path': network_path, 'key': entry.get('key')})
+    return networks
+
+
+def _encoded(state, name):
+    # every worker loads and encodes a network the first time one of its jobs needs it,
+    # and keeps it in a memory-bounded LRU cache; networks of a store are memory-mapped
+    # with their stored factorizations, and the sampling-based metrics need dense
+    # factors, so sparse networks are densified
+    if 'encoded' not in state:
+        state['encoded'] = EncodedNetworkCache(state['max_cache_bytes'])
+    network = state['encoded'].get(name)
+    if network is None:
+        entry = state['networks'][name]
+        if os.path.isdir(entry['path']):
+            network = NetworkStore(entry['path']).get(name)
+            if network.is_sparse:
+                network = EncodedNetwork(network.W.toarray())
+        else:
+            W = load_network(entry['path'], entry['key'])
+            network = EncodedNetwork(W.toarray() if sp.issparse(W) else np.asarray(W))
+        state['encoded'].put(name, network)
+    return network
+
+
+def _fisher_ensemble(W_a, theta_mat, rng, chunk_size=10):
+    def perturbed_networks():
+        for theta in theta_mat:
+            weight_base = np.abs(rng.normal(0, np.mean(theta), W_a.shape))
+            yield W_a * convert_to_symmetric_with_zero_diagonal(weight_base)
+    return iter_sigma_ensemble(perturbed_networks(), chunk_size)
+
+
+def _functions(state):
+    # the metric functions of a worker, wrapped to read and write the result cache if one is configured
+    if 'functions' not in state:
+        functions = {
+            'divergence': infomation_divergence,
+            'mi': mutual_infomation,
+            'fisher': fisher_information,
+            'causality': granger_causality_and_transfer_entropy,
+        }
+        if state.get('result_cache'):
+            cached = memoize(ResultCache(state['result_cache']))
+            functions = {metric: cached(func) for metric, func in functions.items()}
+        state['functions'] = functions
+    return state['functions']
+
+
+def _run_job(state, job):
+    name_a, name_b, metric, spawn_key = job
+    params = state['params']
+    functions = _functions(state)
+    network_a, network_b = _encoded(state, name_a), _encoded(state, name_b)
+    seed = np.random.SeedSequence(state['entropy'], spawn_key=spawn_key)
+
+    if metric == 'divergence':
+        net_approx = network_approximation(network_a, network_b)
+        d_ab, d_ba = functions['divergence'](net_approx['new_sigma_a'], net_approx['new_sigma_b'])
+        results = {'d_ab': d_ab, 'd_ba': d_ba, 'gamma': net_approx['gamma']}
+    elif metric == 'mi':
+        h_a, h_b, h_ab, i_ab = functions['mi'](network_a, network_b, params['sample_num'], params['k'], seed=seed)
+        results = {'h_a': h_a, 'h_b': h_b, 'h_ab': h_ab, 'i_ab': i_ab}
+    elif metric == 'fisher':
+        for network, name in ((network_a, name_a), (network_b, name_b)):
+            if network.W is None:
+                raise ValueError('The fisher metric perturbs the adjacency matrices, but network {} is stored '
+                                 'without W'.format(name))
+        # the parameter vector is a random choice of node degrees of network b, see experiments/random_network.py
+        rng = np.random.default_rng(seed)
+        W_a, W_b = network_a.W, network_b.W
+        deg_b = np.sum(W_b, axis=0)
+        theta_mat = np.array([deg_b[rng.permutation(W_b.shape[0])[:params['theta_number']]]
+                              for _ in range(params['o_number'])])
+        theta_mat = np.unique(theta_mat, axis=0)
+        fisher_info_mat = functions['fisher'](_fisher_ensemble(W_a, theta_mat, rng), theta_mat)
+        results = {'fisher_trace_mean': np.mean(np.trace(fisher_info_mat, axis1=1, axis2=2))}
+    else:
+        _, g_ab, _, t_ab, _ = functions['causality'](
+            network_a, network_b, params['sample_num'], params['rand_p_num'], params['k'], seed)
+        results = {'g_ab': g_ab, 't_ab': t_ab}
+
+    # the cached encodings of the networks grew during the job
+    state['encoded'].update(name_a)
+    state['encoded'].update(name_b)
+    return [[name_a, name_b, metric, quantity, repr(float(np.real(value)))] for quantity, value in results.items()]
+
+
+def job_spawn_key(name_a, name_b, metric):
+    """
+    Output:
+    the spawn key of the seed of a job, derived from the names of its networks and
+    metric only, so that reordering or extending the manifest or the metrics does
+    not change the samples of other jobs
+    """
+    digest = hashlib.blake2b('{}\0{}\0{}'.format(name_a, name_b, metric).encode(), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+
+
+def run_entropy(path, seed=None):
+    """
+    Input:
+    path: the results file of the run
+    seed: the seed given to the run, None to reuse the one of the run it resumes
+
+    Output:
+    the entropy of the SeedSequence of the run, recorded in path + '.seed.json' so
+    that a resumed run without a seed draws the same samples as the one it resumes
+    """
+    seed_path = path + '.seed.json'
+    recorded = None
+    if os.path.exists(seed_path):
+        with open(seed_path) as f:
+            recorded = json.load(f)['entropy']
+    entropy = np.random.SeedSequence(seed if seed is not None else recorded).entropy
+    assert recorded is None or entropy == recorded, \
+        'The results in {} were computed with another seed, use another output file'.format(path)
+    if recorded is None:
+        fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'entropy': entropy}, f)
+        os.replace(temporary_path, seed_path)
+    return entropy
+
+
+def read_finished_jobs(path):
+    """
+    Output:
+    the set of (network_a, network_b, metric) whose quantities are all present in
+    the results file. The rows of unfinished jobs, left by a run killed while
+    writing them, and a last line cut without its newline are removed from the
+    file, so that those jobs are written again in full.
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, newline='') as f:
+        content = f.read()
+    complete = content[:content.rfind('\n') + 1]
+    rows = list(csv.reader(io.StringIO(complete)))[1:]
+
+    quantities = {}
+    for row in rows:
+        quantities.setdefault(tuple(row[:3]), set()).add(row[3])
+    finished = {job for job, present in quantities.items()
+                if job[2] in QUANTITIES and set(QUANTITIES[job[2]]) <= present}
+
+    kept = [row for row in rows if tuple(row[:3]) in finished]
+    if len(kept) != len(rows) or complete != content:
+        # replace the file atomically, a crash here leaves the old file
+        fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.csv')
+        with os.fdopen(fd, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            writer.writerows(kept)
+        os.replace(temporary_path, path)
+    return finished
+
+
+def run(config):
+    """
+    Compute the requested metrics between every pair of networks of a manifest on a
+    worker pool, appending the results of every finished job to a long-format CSV
+    file (network_a, network_b, metric, quantity, value). Jobs already present in the
+    file are skipped, so an interrupted run resumes where it stopped. Job seeds are
+    derived from the seed and the names of the networks and metric of the job, so
+    resumed or reordered runs draw the same samples as uninterrupted ones; the seed
+    of a run without one is recorded next to the file, see run_entropy. With a
+    result_cache file, results of identical inputs computed by earlier runs, e.g.
+    overlapping sweeps, are read from it. Every worker keeps the encoded networks
+    in a cache of max_cache_bytes, 1 GiB by default.
+    """
+    networks = read_manifest(config['manifest'])
+    metrics = config.get('metrics') or ['divergence']
+    assert all(metric in METRICS for metric in metrics), 'Unknown metric in {}, available: {}'.format(metrics, METRICS)
+    output = config.get('output') or 'results.csv'
+    finished = read_finished_jobs(output)
+
+    jobs = []
+    for metric in metrics:
+        for a, network_a in enumerate(networks):
+            for b, network_b in enumerate(networks):
+                # a symmetric metric is computed for the pair ordered by name, whatever the manifest order
+                if a == b or (metric in SYMMETRIC_METRICS and network_a['name'] > network_b['name']):
+                    continue
+                if (network_a['name'], network_b['name'], metric) not in finished:
+                    jobs.append((network_a['name'], network_b['name'], metric,
+                                 job_spawn_key(network_a['name'], network_b['name'], metric)))
+    print('{} jobs, {} already finished'.format(len(jobs), len(finished)))
+
+    state = {
+        'networks': {network['name']: network for network in networks},
+        'entropy': run_entropy(output, config.get('seed')),
+        'result_cache': config.get('result_cache'),
+        'max_cache_bytes': config.get('max_cache_bytes') or 2**30,
+        'params': {
+            'sample_num': config.get('sample_num') or 5000,
+            'k': config.get('k') or 2,
+            'rand_p_num': config.get('rand_p_num') or 20,
+            'theta_number': 10,
+            'o_number': 100,
+        },
+    }
+    new_file = not os.path.exists(output)
+    with open(output, 'a', newline='') as f:
+        if new_file:
+            csv.writer(f).writerow(FIELDS)
+        for done, rows in enumerate(imap_unordered(_run_job, jobs, config.get('n_jobs'), state)):
+            # the rows of a job go out in one write; a job cut by a crash is dropped on resume
+            record = io.StringIO()
+            csv.writer(record).writerows(rows)
+            f.write(record.getvalue())
+            f.flush()
+            os.fsync(f.fileno())
+            print('[{}/{}] {} -> {}: {}'.format(done + 1, len(jobs), rows[0][0], rows[0][1], rows[0][2]))
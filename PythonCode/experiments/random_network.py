@@ -3,7 +3,7 @@ from scipy.io import savemat
 
 from random_networks import ErdosRenyiNetwork, WattsStrogatzNetwork
 from toolkit import infomation_divergence, mutual_infomation, fisher_information, \
-    granger_causality_and_transfer_entropy, generate_random_variable, \
+    granger_causality_and_transfer_entropy, generate_random_variable, iter_sigma_ensemble, \
     network_approximation, convert_to_symmetric_with_zero_diagonal
 
 
@@ -13,7 +13,9 @@ def run(config):
     W_a = network_a * (np.triu(weight_base_a, 1) + np.triu(weight_base_a, 1).T)
     # np.save('W_a.npy', W_a)
 
-    network_b = ErdosRenyiNetwork(500, 0.2, seed=100)
+    # ErdosRenyiNetwork(..., seed=100) used to reseed the global random state, which the weights below rely on
+    np.random.seed(100)
+    network_b = ErdosRenyiNetwork(500, 0.2)
     weight_base_b = 1 + np.random.rand(network_b.shape[0], network_b.shape[1]) * 9
     W_b = network_b * (np.triu(weight_base_b, 1) + np.triu(weight_base_b, 1).T)
     # np.save('W_b.npy', W_b)
@@ -59,23 +61,24 @@ def run(config):
         theta_mat[i] = deg_new_network[random_id_b[:theta_number]]
     theta_mat = np.unique(theta_mat, axis=0)
 
-    sigma_ensemble = np.zeros((o_number, Sigma_a.shape[0], Sigma_a.shape[1]))
-    for i in range(o_number):
-        weight_base = np.abs(np.random.normal(0, np.mean(theta_mat[i], axis=0), Sigma_a.shape))
-        _, _, noise_sigma_a1 = generate_random_variable(W_a * convert_to_symmetric_with_zero_diagonal(weight_base))
-        sigma_ensemble[i] = noise_sigma_a1
-    
-    # print(sigma_ensemble.shape)
+    def perturbed_networks():
+        for i in range(o_number):
+            weight_base = np.abs(np.random.normal(0, np.mean(theta_mat[i], axis=0), Sigma_a.shape))
+            yield W_a * convert_to_symmetric_with_zero_diagonal(weight_base)
+
+    # the ensemble is encoded in batched chunks and streamed into fisher_information
+    sigma_ensemble = iter_sigma_ensemble(perturbed_networks(), chunk_size=10)
     fisher_info_mat = fisher_information(sigma_ensemble, theta_mat)
     print('fisher_info_mat: {}'.format(fisher_info_mat))
     print()
 
     # granger causality and transfer entropy
     rand_p_num = 20
+    seed_ab, seed_ba = np.random.SeedSequence(config.get('seed')).spawn(2)
     g_ab_vec, g_ab, t_ab_vec, t_ab, size_ab_vec = granger_causality_and_transfer_entropy(Sigma_a, Sigma_b, 
-                                                    sample_num, rand_p_num, k)
+                                                    sample_num, rand_p_num, k, seed_ab, config.get('n_jobs'))
     g_ba_vec, g_ba, t_ba_vec, t_ba, size_ba_vec = granger_causality_and_transfer_entropy(Sigma_b, Sigma_a,
-                                                    sample_num, rand_p_num, k)
+                                                    sample_num, rand_p_num, k, seed_ba, config.get('n_jobs'))
     # print('t_ab_vec: {}'.format(t_ab_vec))
     print('t_ab: {}'.format(t_ab))
     # print('g_ab_vec: {}'.format(g_ab_vec))
@@ -6,6 +6,21 @@ from utils import import_attr
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("--exp", type=str, default="", help="")
+    parser.add_argument("--n_jobs", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the random partitions")
+    parser.add_argument("--manifest", type=str, default=None, help="manifest of networks for --exp batch")
+    parser.add_argument("--metrics", type=str, default="divergence",
+                        help="comma-separated metrics for --exp batch: divergence,mi,fisher,causality")
+    parser.add_argument("--output", type=str, default=None, help="results file of --exp batch")
+    parser.add_argument("--sample_num", type=int, default=None, help="number of samples")
+    parser.add_argument("--k", type=int, default=None, help="number of nearest neighbors")
+    parser.add_argument("--rand_p_num", type=int, default=None, help="number of random partitions")
+    parser.add_argument("--result_cache", type=str, default=None,
+                        help="sqlite file caching the metric results of --exp batch across runs")
+    parser.add_argument("--max_cache_bytes", type=int, default=None,
+                        help="memory budget of the encoded networks of every --exp batch worker")
+    parser.add_argument("--profile", type=str, default=None,
+                        help="write a Chrome trace of the toolkit spans to this file, with a summary next to it")
     
     args, unknown_args = parser.parse_known_args()
     return args
@@ -15,9 +30,28 @@ def main(args):
     exp = args.exp
     run_exp = import_attr("experiments.{}.run".format(exp))
 
-    config = {}
-
-    run_exp(config)
+    config = {
+        'n_jobs': args.n_jobs,
+        'seed': args.seed,
+        'manifest': args.manifest,
+        'metrics': args.metrics.split(','),
+        'output': args.output,
+        'sample_num': args.sample_num,
+        'k': args.k,
+        'rand_p_num': args.rand_p_num,
+        'result_cache': args.result_cache,
+        'max_cache_bytes': args.max_cache_bytes,
+    }
+
+    if args.profile is None:
+        run_exp(config)
+        return
+
+    from toolkit import profile
+    with profile() as profiler:
+        run_exp(config)
+    profiler.to_chrome_trace(args.profile)
+    profiler.to_json(args.profile + '.summary.json')
 
 
 if __name__ == "__main__":
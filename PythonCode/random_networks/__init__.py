@@ -1,2 +1,4 @@
 from .erdos_renyi import ErdosRenyiNetwork
 from .watts_strogatz import WattsStrogatzNetwork
+from .barabasi_albert import BarabasiAlbertNetwork
+from .utils import edges_to_graph
@@ -0,0 +1,41 @@
+import numpy as np
+
+from .utils import edges_to_graph, resolve_rng
+
+
+def BarabasiAlbertNetwork(n, m0, seed=None, output='dense'):
+    """
+    Barabasi-Albert network grown from a ring of m0 nodes, where every new node
+    attaches to m0 distinct existing nodes with probabilities proportional to
+    their degrees. The endpoints of all edges are kept in one flat array, so a
+    node is drawn with probability proportional to its degree by sampling a
+    uniform position of that array, in O(m) time and memory overall.
+
+    Input:
+    n: the number of nodes
+    m0: the number of nodes in the initial ring and of edges added per new node
+    seed: None, an int, a SeedSequence or a numpy.random.Generator, see resolve_rng
+    output: 'dense', 'coo', 'csr' or 'edges', see edges_to_graph
+
+    Output:
+    G: the adjacency matrix of the network
+    """
+    assert 2 <= m0 < n, 'm0 should be at least 2 and smaller than n'
+    rng = resolve_rng(seed)
+    ring = np.arange(m0) if m0 > 2 else np.arange(1)
+    initial_edges = np.stack((ring, (ring + 1) % m0), axis=1)
+
+    edges = np.zeros((initial_edges.shape[0] + (n - m0) * m0, 2), dtype=np.int64)
+    edges[:initial_edges.shape[0]] = initial_edges
+    endpoints = edges.reshape(-1)
+    edge_num = initial_edges.shape[0]
+    for node in range(m0, n):
+        targets = set()
+        while len(targets) < m0:
+            positions = rng.integers(0, 2 * edge_num, size=m0 - len(targets))
+            targets.update(endpoints[positions].tolist())
+        targets = list(targets)
+        edges[edge_num:edge_num+m0, 0] = node
+        edges[edge_num:edge_num+m0, 1] = targets
+        edge_num += m0
+    return edges_to_graph(edges, n, output)
@@ -1,10 +1,39 @@
 import numpy as np
 
+from .utils import edges_to_graph, resolve_rng
 
-def ErdosRenyiNetwork(n, p, seed=None):
-    if seed:
-        np.random.seed(seed)
-    G = np.random.rand(n, n) < p
-    G = np.triu(G, 1)
-    G = G + G.T
-    return G
+
+def ErdosRenyiNetwork(n, p, seed=None, output='dense'):
+    """
+    Sample an Erdos-Renyi network by geometric edge skipping: the gaps between
+    consecutive present edges in the list of the n*(n-1)/2 node pairs are
+    geometric, so only the O(m) present edges are ever drawn.
+
+    Input:
+    n: the number of nodes
+    p: the connection probability
+    seed: None, an int, a SeedSequence or a numpy.random.Generator, see resolve_rng
+    output: 'dense', 'coo', 'csr' or 'edges', see edges_to_graph
+
+    Output:
+    G: the adjacency matrix of the network
+    """
+    rng = resolve_rng(seed)
+    total = n * (n - 1) // 2
+    positions = []
+    if p > 0 and total > 0:
+        chunk = int(total * p + 10 * np.sqrt(total * p) + 16)
+        last = -1
+        while last < total:
+            pair = last + np.cumsum(rng.geometric(p, size=chunk))
+            positions.append(pair[pair < total])
+            last = pair[-1]
+    t = np.concatenate(positions) if positions else np.zeros(0, dtype=np.int64)
+
+    # pair t of the lower triangle, ordered row by row, is (i, j) with j < i
+    i = ((1 + np.sqrt(1 + 8 * t.astype(float))) // 2).astype(np.int64)
+    i[i * (i - 1) // 2 > t] -= 1
+    i[(i + 1) * i // 2 <= t] += 1
+    j = t - i * (i - 1) // 2
+    edges = np.stack((j, i), axis=1)
+    return edges_to_graph(edges, n, output)
@@ -0,0 +1,42 @@
+import numpy as np
+import scipy.sparse as sp
+
+
+def resolve_rng(seed):
+    """
+    Input:
+    seed: None, an int, a SeedSequence or a numpy.random.Generator
+
+    Output:
+    a numpy.random.Generator; for None it is seeded from the global numpy random
+    state, so networks drawn after np.random.seed(...) are reproducible
+    """
+    if seed is None:
+        return np.random.default_rng(np.random.randint(0, 2**63 - 1, dtype=np.int64))
+    return np.random.default_rng(seed)
+
+
+def edges_to_graph(edges, n, output='dense'):
+    """
+    Input:
+    edges: m*2 matrix of undirected edges (i, j), each edge listed once
+    n: the number of nodes
+    output: 'dense' for an n*n matrix, 'coo' or 'csr' for a scipy.sparse matrix,
+        'edges' for the edge list itself
+
+    Output:
+    G: the symmetric adjacency matrix, or the edge list
+    """
+    assert output in ('dense', 'coo', 'csr', 'edges'), 'Unknown output format: {}'.format(output)
+    if output == 'edges':
+        return edges
+    rows = np.concatenate((edges[:, 0], edges[:, 1]))
+    cols = np.concatenate((edges[:, 1], edges[:, 0]))
+    if output == 'dense':
+        G = np.zeros((n, n))
+        G[rows, cols] = 1
+        return G
+    G = sp.coo_matrix((np.ones(rows.shape[0]), (rows, cols)), shape=(n, n))
+    if output == 'csr':
+        return G.tocsr()
+    return G
@@ -1,25 +1,81 @@
 import numpy as np
 
+from .utils import edges_to_graph, resolve_rng
 
-def WattsStrogatzNetwork(n, k, beta):
-    s = np.repeat(np.arange(1, n+1).reshape(-1, 1), k, 1)
-    t = s + np.repeat(np.arange(1, k+1).reshape(1, -1), n, 0)
-    t = (t-1) % n + 1
 
-    # for source in range(n):
-    #     switch_edge = np.random.rand(k) < beta
-        
-    #     new_targets = np.random.rand(n)
-    #     new_targets[source] = 0
-    #     new_targets[s[t==source+1]-1] = 0
-    #     new_targets[t[source, ~switch_edge]-1] = 0
+def WattsStrogatzNetwork(n, k, beta, seed=None, output='dense'):
+    """
+    Watts-Strogatz network with n nodes, n*k edges, mean node degree 2*k and
+    rewiring probability beta. beta = 0 is a ring lattice, and beta = 1 is a
+    random graph.
 
-    #     ind = np.argsort(new_targets)[::-1]
-    #     t[source, switch_edge] = ind[:np.count_nonzero(switch_edge)]
+    Every edge of the ring lattice has its target rewired with probability beta,
+    source by source as in MatlabCode/WattsStrogatz.m: the new targets of a source
+    are distinct nodes drawn uniformly among those it is not connected to, which
+    always include the targets being rewired, so no redraw loop is needed. The
+    neighbors of every node are kept in sets, so the rewiring takes O(n*k) time
+    and memory.
 
-    graph_edges = np.concatenate((s.reshape(-1, 1), t.reshape(-1, 1)), 1)
-    adjancency_matrix = np.zeros((n, n))
-    adjancency_matrix[graph_edges[:, 0]-1, graph_edges[:, 1]-1] = 1
-    adjancency_matrix[graph_edges[:, 1]-1, graph_edges[:, 0]-1] = 1
+    Input:
+    n: the number of nodes
+    k: the number of next neighbors each node is connected to, k < n/2
+    beta: the rewiring probability
+    seed: None, an int, a SeedSequence or a numpy.random.Generator, see resolve_rng
+    output: 'dense', 'coo', 'csr' or 'edges', see edges_to_graph
 
-    return adjancency_matrix
+    Output:
+    G: the adjacency matrix of the network
+    """
+    assert 2 * k < n, 'k should be smaller than n/2'
+    rng = resolve_rng(seed)
+    s = np.repeat(np.arange(n), k)
+    t = (s + np.tile(np.arange(1, k+1), n)) % n
+
+    switch_edge = rng.random(n * k) < beta
+    rewired = np.flatnonzero(switch_edge)
+    if rewired.shape[0] == 0:
+        return edges_to_graph(np.stack((s, t), axis=1), n, output)
+
+    sources, targets = s.tolist(), t.tolist()
+    neighbors = [set() for _ in range(n)]
+    for i, j in zip(sources, targets):
+        neighbors[i].add(j)
+        neighbors[j].add(i)
+    candidates = _uniform_nodes(n, rng)
+    # the rewired edges of a source are consecutive, since s is sorted
+    for edges_of_source in np.split(rewired, np.flatnonzero(np.diff(s[rewired])) + 1):
+        edges_of_source = edges_of_source.tolist()
+        source = sources[edges_of_source[0]]
+        for e in edges_of_source:
+            neighbors[source].discard(targets[e])
+            neighbors[targets[e]].discard(source)
+        new_targets = _free_nodes(neighbors[source] | {source}, len(edges_of_source), n, rng, candidates)
+        for e, j in zip(edges_of_source, new_targets):
+            targets[e] = j
+            neighbors[source].add(j)
+            neighbors[j].add(source)
+
+    edges = np.stack((s, np.array(targets, dtype=s.dtype)), axis=1)
+    return edges_to_graph(edges, n, output)
+
+
+def _uniform_nodes(n, rng, block_size=4096):
+    # uniform nodes of 0..n-1, drawn from rng by blocks
+    while True:
+        yield from rng.integers(0, n, size=block_size).tolist()
+
+
+def _free_nodes(excluded, count, n, rng, candidates):
+    # count distinct nodes drawn uniformly from the nodes of 0..n-1 that are not in
+    # the set excluded, which is updated with them
+    if len(excluded) > n // 2:
+        free = np.setdiff1d(np.arange(n), np.fromiter(excluded, dtype=np.int64, count=len(excluded)))
+        return rng.choice(free, count, replace=False).tolist()
+    # at least half of the nodes are free, so few rounds of rejection are needed
+    chosen = []
+    for j in candidates:
+        if j not in excluded:
+            excluded.add(j)
+            chosen.append(j)
+            if len(chosen) == count:
+                return chosen
@@ -0,0 +1,3 @@
+from .cache import EncodedNetworkCache, network_nbytes
+from .server import NetworkService, METRICS
+from .client import request
@@ -0,0 +1,26 @@
+import argparse
+import asyncio
+
+from .server import NetworkService
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Local network similarity service')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on')
+    parser.add_argument('--unix', type=str, default=None, help='listen on this Unix socket instead')
+    parser.add_argument('--store', type=str, default=None, help='directory of a NetworkStore')
+    parser.add_argument('--max_cache_mb', type=float, default=1024, help='memory budget of the encoded networks')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker threads')
+    return parser.parse_args()
+
+
+async def main(args):
+    service = NetworkService(args.store, int(args.max_cache_mb * 2**20), args.workers)
+    await service.start(args.host, args.port, args.unix)
+    print('Listening on {}'.format(args.unix or '{}:{}'.format(*service.address[:2])), flush=True)
+    await service.serve_forever()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,110 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import scipy.sparse as sp
+
+
+def network_nbytes(network):
+    """
+    Input:
+    network: an EncodedNetwork
+
+    Output:
+    the bytes held in memory by W and the cached encodings of the network;
+    memory-mapped arrays are not counted, they live in the page cache
+    """
+    total = 0
+    for value in [network.W] + list(network.__dict__.values()):
+        if isinstance(value, np.memmap):
+            continue
+        if isinstance(value, np.ndarray):
+            total += value.nbytes
+        elif sp.issparse(value):
+            value = value.tocsr() if not sp.isspmatrix_csr(value) else value
+            total += sum(array.nbytes for array in (value.data, value.indices, value.indptr)
+                         if not isinstance(array, np.memmap))
+    return total
+
+
+class EncodedNetworkCache(object):
+    """
+    LRU cache of EncodedNetworks bounded by the bytes of their arrays. The size of
+    a network grows as its cached encodings are computed, so it is measured again
+    with update after every use, which also evicts the least recently used
+    networks until the cache fits in max_bytes. The most recently used network is
+    never evicted, even if it is larger than max_bytes on its own.
+
+    Input:
+    max_bytes: the memory budget of the cache
+    """
+
+    def __init__(self, max_bytes=2**30):
+        self.max_bytes = max_bytes
+        self._networks = OrderedDict()
+        self._nbytes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self._networks
+
+    def __len__(self):
+        return len(self._networks)
+
+    @property
+    def nbytes(self):
+        return sum(self._nbytes.values())
+
+    def keys(self):
+        with self._lock:
+            return list(self._networks)
+
+    def get(self, key):
+        """
+        Output:
+        the cached network, or None
+        """
+        with self._lock:
+            network = self._networks.get(key)
+            if network is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._networks.move_to_end(key)
+            return network
+
+    def put(self, key, network):
+        with self._lock:
+            self._networks[key] = network
+            self._networks.move_to_end(key)
+            self._nbytes[key] = network_nbytes(network)
+            self._evict()
+        return network
+
+    def update(self, key):
+        """
+        measure the network again after its encodings changed and evict if needed
+        """
+        with self._lock:
+            if key in self._networks:
+                self._nbytes[key] = network_nbytes(self._networks[key])
+                self._evict()
+
+    def _evict(self):
+        while len(self._networks) > 1 and sum(self._nbytes.values()) > self.max_bytes:
+            key, _ = self._networks.popitem(last=False)
+            del self._nbytes[key]
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            'networks': len(self._networks),
+            'nbytes': self.nbytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,49 @@
+import io
+import json
+import socket
+
+import numpy as np
+
+
+def request(address, method, path, payload=None, W=None, timeout=None):
+    """
+    Send one request to a NetworkService.
+
+    Input:
+    address: (host, port) of a TCP service, or the path of a Unix socket
+    method: 'GET' or 'POST'
+    path: the endpoint, e.g. '/metric'
+    payload: a JSON-serializable request body
+    W: a weighted adjacent matrix uploaded as .npy bytes instead of a JSON body
+    timeout: the socket timeout in seconds
+
+    Output:
+    status: the HTTP status code
+    response: the decoded JSON response
+    """
+    if W is not None:
+        buffer = io.BytesIO()
+        np.save(buffer, np.asarray(W), allow_pickle=False)
+        body, content_type = buffer.getvalue(), 'application/x-npy'
+    else:
+        body, content_type = json.dumps(payload).encode() if payload is not None else b'', 'application/json'
+
+    if isinstance(address, str):
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    connection.settimeout(timeout)
+    with connection:
+        connection.connect(address if isinstance(address, str) else tuple(address[:2]))
+        connection.sendall('{} {} HTTP/1.1\r\nHost: localhost\r\nContent-Type: {}\r\nContent-Length: {}\r\n'
+                           'Connection: close\r\n\r\n'.format(method, path, content_type, len(body)).encode() + body)
+        chunks = []
+        while True:
+            chunk = connection.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+
+    head, _, content = b''.join(chunks).partition(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    return status, json.loads(content)
@@ -0,0 +1,264 @@
+import asyncio
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from toolkit import EncodedNetwork, NetworkStore, content_hash, infomation_divergence, mutual_infomation, \
+    granger_causality_and_transfer_entropy, network_approximation, stochastic_infomation_divergence
+
+from .cache import EncodedNetworkCache
+
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class RequestError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _prepare(network, inverse):
+    # compute the encodings shared by the metrics once, before the metrics read them;
+    # the inverse of Sigma is only read by the exact divergence
+    if network.is_sparse:
+        network.sigma
+    else:
+        network.cholesky
+        if inverse:
+            network.inv
+    network.logdet
+    return network
+
+
+def _divergence(network_a, network_b, params):
+    gamma = 1.0
+    if network_a.shape != network_b.shape:
+        net_approx = network_approximation(network_a, network_b)
+        network_a, network_b, gamma = net_approx['new_sigma_a'], net_approx['new_sigma_b'], net_approx['gamma']
+    d_ab, d_ba = infomation_divergence(network_a, network_b)
+    return {'d_ab': d_ab, 'd_ba': d_ba, 'gamma': gamma}
+
+
+def _stochastic_divergence(network_a, network_b, params):
+    d_ab, d_ba, d_ab_error, d_ba_error = stochastic_infomation_divergence(network_a, network_b, **params)
+    return {'d_ab': d_ab, 'd_ba': d_ba, 'd_ab_error': d_ab_error, 'd_ba_error': d_ba_error}
+
+
+def _mutual_information(network_a, network_b, params):
+    h_a, h_b, h_ab, i_ab = mutual_infomation(network_a, network_b, params.get('sample_num', 5000),
+                                             params.get('k', 2), seed=params.get('seed'))
+    return {'h_a': h_a, 'h_b': h_b, 'h_ab': h_ab, 'i_ab': i_ab}
+
+
+def _causality(network_a, network_b, params):
+    g_ab_vec, g_ab, t_ab_vec, t_ab, _ = granger_causality_and_transfer_entropy(
+        network_a, network_b, params.get('sample_num', 5000), params.get('rand_p_num', 20), params.get('k', 2),
+        seed=params.get('seed'))
+    return {'g_ab': g_ab, 't_ab': t_ab, 'g_ab_vec': g_ab_vec.tolist(), 't_ab_vec': t_ab_vec.tolist()}
+
+
+METRICS = {
+    'divergence': _divergence,
+    'stochastic_divergence': _stochastic_divergence,
+    'mi': _mutual_information,
+    'causality': _causality,
+}
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('{} is not JSON serializable'.format(type(value)))
+
+
+class NetworkService(object):
+    """
+    Long-lived local service computing the toolkit metrics between networks. The
+    encodings of the networks are kept in a memory-bounded LRU cache shared by
+    all requests, metrics, encodings and the decoding and hashing of uploads run on
+    a thread pool (numpy and LAPACK release the GIL) instead of the event loop, and
+    identical requests in flight are coalesced into one computation.
+
+    Endpoints, all answering JSON:
+    GET /health
+    GET /stats: the cache and request counters
+    GET /networks: the cached networks and the names of the stored ones
+    POST /networks: upload a network, as JSON {"W": [[...]]} or as the bytes of a
+        .npy file with Content-Type application/x-npy; answers {"id": ..., "n": ...}
+    POST /metric: {"metric": "divergence" | "stochastic_divergence" | "mi" |
+        "causality", "a": reference, "b": reference, "params": {...}}, where a
+        reference is the id of an uploaded network, "store:<name>" for a network
+        of the NetworkStore, or an inline {"W": [[...]]}
+
+    Input:
+    store: a NetworkStore, or its directory; uploaded networks are also written to
+        it so that they can be encoded again after being evicted from the cache
+    max_cache_bytes: the memory budget of the encoded networks
+    max_workers: the number of worker threads
+    """
+
+    def __init__(self, store=None, max_cache_bytes=2**30, max_workers=None):
+        self.store = NetworkStore(store) if isinstance(store, str) else store
+        self.cache = EncodedNetworkCache(max_cache_bytes)
+        self.executor = ThreadPoolExecutor(max_workers)
+        self.server = None
+        self._in_flight = {}
+        self.counters = {'requests': 0, 'computed': 0, 'coalesced': 0}
+
+    async def start(self, host='127.0.0.1', port=0, path=None):
+        """
+        Listen on host:port, or on the Unix socket path if given; port 0 picks a free port.
+        """
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self._handle, path)
+        else:
+            self.server = await asyncio.start_server(self._handle, host, port)
+        return self.server
+
+    @property
+    def address(self):
+        return self.server.sockets[0].getsockname()
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.executor.shutdown(wait=False)
+
+    async def _run(self, func, *args):
+        # run blocking work on the thread pool, the event loop keeps serving other requests
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def _coalesce(self, key, func, *args):
+        """
+        run func(*args) on the thread pool, or wait for the run already in flight with the same key
+        """
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            self.counters['computed'] += 1
+        else:
+            self.counters['coalesced'] += 1
+        # a client that goes away does not cancel the computation of the others
+        return await asyncio.shield(future)
+
+    def _add_upload(self, W):
+        # called on the thread pool, hashing and storing a network take O(n^2)
+        W = np.ascontiguousarray(W, dtype=np.float64)
+        if W.ndim != 2 or W.shape[0] != W.shape[1]:
+            raise RequestError(400, 'The adjacency matrix must be square')
+        key = content_hash(W)
+        if key not in self.cache:
+            self.cache.put(key, EncodedNetwork(W))
+            if self.store is not None and key not in self.store:
+                self.store.put(key, W, arrays=())
+        return key
+
+    def _read_upload(self, headers, body):
+        if headers.get('content-type') == 'application/x-npy':
+            W = np.load(io.BytesIO(body), allow_pickle=False)
+        else:
+            W = json.loads(body)['W']
+        key = self._add_upload(W)
+        return {'id': key, 'n': W.shape[0] if isinstance(W, np.ndarray) else len(W)}
+
+    async def _network(self, reference, inverse=False):
+        """
+        Input:
+        reference: see the /metric endpoint
+        inverse: whether the metric reads the inverse of Sigma
+
+        Output:
+        key: the cache key of the network
+        network: the EncodedNetwork, with its shared encodings computed
+        """
+        if isinstance(reference, dict) and 'W' in reference:
+            key = await self._run(self._add_upload, reference['W'])
+        elif isinstance(reference, str):
+            key = reference
+        else:
+            raise RequestError(400, 'A network reference is an id, "store:<name>" or {"W": [[...]]}')
+
+        network = self.cache.get(key)
+        if network is None:
+            name = key[len('store:'):] if key.startswith('store:') else key
+            if self.store is None or name not in self.store:
+                raise RequestError(404, 'Unknown network {}, upload it again'.format(key))
+            network = self.cache.put(key, await self._run(self.store.get, name))
+        await self._coalesce(('prepare', key, inverse), _prepare, network, inverse)
+        self.cache.update(key)
+        return key, network
+
+    async def _metric(self, request):
+        metric = request.get('metric')
+        if metric not in METRICS:
+            raise RequestError(400, 'Unknown metric {}, available: {}'.format(metric, sorted(METRICS)))
+        params = request.get('params') or {}
+        key_a, network_a = await self._network(request.get('a'), metric == 'divergence')
+        key_b, network_b = await self._network(request.get('b'), metric == 'divergence')
+        key = (metric, key_a, key_b, json.dumps(params, sort_keys=True))
+        result = await self._coalesce(key, METRICS[metric], network_a, network_b, params)
+        self.cache.update(key_a)
+        self.cache.update(key_b)
+        return dict(result, a=key_a, b=key_b)
+
+    async def _dispatch(self, method, path, headers, body):
+        if path == '/health' and method == 'GET':
+            return {'status': 'ok'}
+        if path == '/stats' and method == 'GET':
+            return dict(self.counters, cache=self.cache.stats(), in_flight=len(self._in_flight))
+        if path == '/networks' and method == 'GET':
+            return {'cached': self.cache.keys(), 'stored': self.store.names() if self.store is not None else []}
+        if path == '/networks' and method == 'POST':
+            return await self._run(self._read_upload, headers, body)
+        if path == '/metric' and method == 'POST':
+            return await self._metric(await self._run(json.loads, body))
+        if path in ('/health', '/stats', '/networks', '/metric'):
+            raise RequestError(405, 'Method {} is not allowed on {}'.format(method, path))
+        raise RequestError(404, 'Unknown path {}'.format(path))
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, value = line.decode('latin-1').split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+        except (ValueError, asyncio.IncompleteReadError):
+            writer.close()
+            return
+
+        self.counters['requests'] += 1
+        try:
+            status, payload = 200, await self._dispatch(method, path, headers, body)
+        except RequestError as error:
+            status, payload = error.status, {'error': str(error)}
+        except (AssertionError, ValueError, KeyError, np.linalg.LinAlgError) as error:
+            status, payload = 400, {'error': '{}: {}'.format(type(error).__name__, error)}
+        except Exception as error:
+            status, payload = 500, {'error': '{}: {}'.format(type(error).__name__, error)}
+
+        content = json.dumps(payload, default=_to_json).encode()
+        writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n'
+                     'Connection: close\r\n\r\n'.format(status, STATUS_TEXT[status], len(content)).encode())
+        writer.write(content)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
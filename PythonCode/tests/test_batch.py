@@ -0,0 +1,53 @@
+import csv
+import json
+import os
+
+import numpy as np
+import pytest
+
+from experiments.batch import run
+from random_networks import ErdosRenyiNetwork
+
+
+def _rows(path):
+    with open(path, newline='') as f:
+        return sorted(tuple(row) for row in csv.reader(f))
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    for i in range(4):
+        W = ErdosRenyiNetwork(12, 0.5, seed=i) * (1 + i)
+        np.save(str(tmp_path / 'n{}.npy'.format(i)), W)
+    with open(str(tmp_path / 'manifest.json'), 'w') as f:
+        json.dump([{'name': 'n{}'.format(i), 'path': 'n{}.npy'.format(i)} for i in range(4)], f)
+    return str(tmp_path / 'manifest.json')
+
+
+def test_batch_resume_reproduces_an_uninterrupted_run(tmp_path, manifest):
+    config = {'manifest': manifest, 'metrics': ['divergence', 'mi'], 'output': str(tmp_path / 'results.csv'),
+              'sample_num': 200}
+    run(config)
+    complete = _rows(config['output'])
+    assert len(complete) == 1 + 6 * 3 + 6 * 4
+    assert os.path.exists(config['output'] + '.seed.json')
+
+    # a run killed while writing leaves a partial job and a cut last line
+    with open(config['output'], newline='') as f:
+        lines = f.readlines()
+    with open(config['output'], 'w', newline='') as f:
+        f.writelines(lines[:12] + [lines[12][:7]])
+    run(config)
+    assert _rows(config['output']) == complete
+
+
+def test_batch_jobs_do_not_depend_on_the_manifest_order(tmp_path, manifest):
+    config = {'manifest': manifest, 'metrics': ['mi'], 'output': str(tmp_path / 'a.csv'), 'sample_num': 200,
+              'seed': 5}
+    run(config)
+    with open(manifest) as f:
+        entries = json.load(f)
+    with open(manifest, 'w') as f:
+        json.dump(entries[::-1], f)
+    run(dict(config, output=str(tmp_path / 'b.csv')))
+    assert _rows(str(tmp_path / 'a.csv')) == _rows(str(tmp_path / 'b.csv'))
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from random_networks import ErdosRenyiNetwork
+from toolkit import EncodedNetwork, IncrementalNetwork, DivergenceTracker, infomation_divergence
+
+
+def _weighted(seed, n=15):
+    W = ErdosRenyiNetwork(n, 0.5, seed=seed) * np.random.default_rng(seed).uniform(1, 2, (n, n))
+    return np.triu(W, 1) + np.triu(W, 1).T
+
+
+def _changes(W, seed, num=20):
+    # weight changes, additions and removals of edges whose ends keep other neighbors,
+    # drawn lazily from the current weights of the network
+    rng = np.random.default_rng(seed)
+    for _ in range(num):
+        i, j = rng.choice(W.shape[0], 2, replace=False)
+        if W[i, j] > 0 and rng.random() < 0.3 and np.sum(W[i] > 0) > 2 and np.sum(W[j] > 0) > 2:
+            yield i, j, -W[i, j]
+        else:
+            yield i, j, rng.uniform(0.1, 1.0)
+
+
+@pytest.mark.parametrize('take_pseudoinverse', [False, True])
+def test_incremental_network_matches_encoding(take_pseudoinverse):
+    network = IncrementalNetwork(_weighted(0), take_pseudoinverse)
+    for i, j, dw in _changes(network.W, 1):
+        network.update_edge(i, j, dw)
+        exact = EncodedNetwork(network.W.copy(), take_pseudoinverse)
+        assert np.allclose(network.sigma, exact.sigma)
+        assert np.allclose(network.inv, exact.inv)
+        assert np.isclose(network.logdet, exact.logdet)
+
+
+@pytest.mark.parametrize('take_pseudoinverse', [False, True])
+def test_divergence_tracker_matches_exact_divergence(take_pseudoinverse):
+    reference = EncodedNetwork(_weighted(2), take_pseudoinverse)
+    tracker = DivergenceTracker(IncrementalNetwork(_weighted(3), take_pseudoinverse), reference)
+    for i, j, dw in _changes(tracker.network.W, 4):
+        divergence = tracker.update_edge(i, j, dw)
+        exact = infomation_divergence(EncodedNetwork(tracker.network.W.copy(), take_pseudoinverse), reference)
+        assert np.allclose(divergence, exact)
+
+
+def test_incremental_network_refuses_disconnection():
+    W = np.zeros((4, 4))
+    for i in range(3):
+        W[i, i+1] = W[i+1, i] = 1.0
+    network = IncrementalNetwork(W)
+    with pytest.raises(np.linalg.LinAlgError):
+        network.remove_edge(1, 2)
+    assert network.W[1, 2] == 1.0
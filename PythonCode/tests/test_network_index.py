@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from random_networks import ErdosRenyiNetwork
+from toolkit import EncodedNetwork, NetworkStore, SpectralIndex, infomation_divergence
+
+
+def _network(seed, n=20):
+    rng = np.random.default_rng(seed)
+    W = ErdosRenyiNetwork(n, rng.uniform(0.3, 0.8), seed=seed) * rng.uniform(0.5, 3, (n, n))
+    return EncodedNetwork(np.triu(W, 1) + np.triu(W, 1).T)
+
+
+def _brute_force(query, networks, k, direction):
+    divergences = []
+    for name, network in networks.items():
+        d_ab, d_ba = infomation_divergence(query, network)
+        divergences.append((name, {'ab': d_ab, 'ba': d_ba, 'symmetric': d_ab + d_ba}[direction]))
+    return sorted(divergences, key=lambda pair: pair[1])[:k]
+
+
+@pytest.mark.parametrize('direction', ['ab', 'ba', 'symmetric'])
+def test_spectral_index_top_k_matches_brute_force(direction):
+    networks = {'net{}'.format(seed): _network(seed) for seed in range(30)}
+    index = SpectralIndex(signature_size=8)
+    for name, network in networks.items():
+        index.add(name, network)
+    # networks of another size are not compared
+    index.add('other', _network(100, 25))
+    for seed in range(200, 205):
+        query = _network(seed)
+        result = index.query(query, k=5, direction=direction)
+        expected = _brute_force(query, networks, 5, direction)
+        assert [name for name, _ in result] == [name for name, _ in expected]
+        assert np.allclose([d for _, d in result], [d for _, d in expected])
+        names, bounds = index.lower_bounds(query, direction)
+        exact = dict(_brute_force(query, networks, len(networks), direction))
+        assert all(bound <= exact[name] + 1e-9 for name, bound in zip(names, bounds))
+
+
+def test_spectral_index_from_store(tmp_path):
+    store = NetworkStore(str(tmp_path))
+    networks = {'net{}'.format(seed): _network(seed) for seed in range(10)}
+    for name, network in networks.items():
+        store.put(name, network, arrays=('sigma', 'inv', 'logdet'))
+    index = SpectralIndex.from_store(store, signature_size=8)
+    query = _network(300)
+    result, expected = index.query(query, k=3), _brute_force(query, networks, 3, 'ab')
+    assert [name for name, _ in result] == [name for name, _ in expected]
+    assert np.allclose([d for _, d in result], [d for _, d in expected])
@@ -0,0 +1,42 @@
+import json
+
+import numpy as np
+
+from toolkit import profile, span, register_span_callback, unregister_span_callback
+
+
+def test_profile_collects_nested_spans():
+    assert span('outside') is span('outside too')
+    with profile(trace_memory=True) as profiler:
+        with span('outer', n=3):
+            with span('inner'):
+                buffer = np.ones(2**16)
+            with span('inner'):
+                pass
+    del buffer
+    with span('after'):
+        pass
+
+    assert [record['name'] for record in profiler.records] == ['inner', 'inner', 'outer']
+    assert [record['depth'] for record in profiler.records] == [1, 1, 0]
+    assert profiler.records[0]['allocated_bytes'] >= 8 * 2**16
+    assert profiler.records[2]['peak_bytes'] >= 8 * 2**16
+    summary = profiler.summary()
+    assert summary['inner']['count'] == 2 and summary['outer']['count'] == 1
+    assert summary['outer']['total'] >= summary['inner']['total']
+    events = json.loads(profiler.to_chrome_trace())['traceEvents']
+    assert [event['name'] for event in events] == ['inner', 'inner', 'outer']
+    assert events[2]['args']['n'] == 3
+
+
+def test_span_callbacks():
+    records = []
+    callback = register_span_callback(records.append)
+    try:
+        with span('called', size=1):
+            pass
+    finally:
+        unregister_span_callback(callback)
+    with span('not called'):
+        pass
+    assert [(record['name'], record['meta']) for record in records] == [('called', {'size': 1})]
@@ -0,0 +1,15 @@
+import numpy as np
+import pytest
+
+from random_networks import WattsStrogatzNetwork
+
+
+@pytest.mark.parametrize('n, k, beta', [(50, 20, 1.0), (60, 25, 0.8), (100, 45, 1.0), (10, 4, 1.0), (30, 3, 0.0)])
+def test_watts_strogatz_dense_rewiring(n, k, beta):
+    # dense k and high beta used to leave sources without free partners in the redraw loop
+    for seed in range(10):
+        G = WattsStrogatzNetwork(n, k, beta, seed=seed)
+        assert np.array_equal(G, G.T)
+        assert not np.any(np.diag(G))
+        assert G.max() == 1
+        assert G.sum() == 2 * n * k
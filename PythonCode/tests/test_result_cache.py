@@ -0,0 +1,62 @@
+import inspect
+import multiprocessing
+
+import numpy as np
+
+from toolkit import EncodedNetwork, ResultCache, memoize
+from toolkit.result_cache import result_key
+
+
+def _draw(x, seed=None):
+    return x + np.random.default_rng(seed.spawn(1)[0]).random()
+
+
+def _put_results(args):
+    path, worker = args
+    cache = ResultCache(path)
+    for i in range(20):
+        cache.put('{}-{}'.format(worker, i), i)
+
+
+def test_result_key_is_stable():
+    W = np.ones((4, 4)) - np.eye(4)
+    key = result_key('f', {'sigma': EncodedNetwork(W), 'k': 2, 'seed': np.random.SeedSequence(1)})
+    assert key == result_key('f', {'sigma': EncodedNetwork(W.copy()), 'k': 2, 'seed': np.random.SeedSequence(1)})
+    assert key != result_key('f', {'sigma': EncodedNetwork(2 * W), 'k': 2, 'seed': np.random.SeedSequence(1)})
+    assert key != result_key('f', {'sigma': EncodedNetwork(W), 'k': 2, 'seed': np.random.SeedSequence(2)})
+    assert key == result_key('f', {'sigma': EncodedNetwork(W), 'k': 2, 'seed': np.random.SeedSequence(1),
+                                   'n_jobs': 4}, ignore=('n_jobs',))
+
+
+def test_memoize_replays_seed_spawns(tmp_path):
+    cached = memoize(ResultCache(str(tmp_path / 'cache.sqlite')))(_draw)
+    assert inspect.signature(cached) == inspect.signature(_draw)
+    assert cached.__name__ == '_draw'
+    for func in (_draw, cached, cached):
+        seed = np.random.SeedSequence(7)
+        values = [func(1, seed=seed), func(2, seed=seed)]
+        if func is _draw:
+            expected = values
+        assert values == expected
+        assert seed.n_children_spawned == 2
+
+
+def test_result_cache_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache.sqlite'), max_bytes=3000)
+    for i in range(10):
+        cache.put(str(i), np.zeros(100))
+    assert cache.stats()['nbytes'] <= 3000
+    assert '9' in cache and '0' not in cache
+    # reading a result makes it the most recent one
+    cache.get('7')
+    cache.put('10', np.zeros(100))
+    assert '7' in cache
+
+
+def test_result_cache_concurrent_writes(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    with multiprocessing.get_context('spawn').Pool(4) as pool:
+        pool.map(_put_results, [(path, worker) for worker in range(4)])
+    cache = ResultCache(path)
+    assert len(cache) == 80
+    assert cache.get('3-19') == 19
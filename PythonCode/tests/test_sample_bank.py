@@ -0,0 +1,28 @@
+import numpy as np
+
+from toolkit import SampleBank, entropy_estimation
+
+
+def _sigma(seed, n=6):
+    A = np.random.default_rng(seed).normal(size=(n, n))
+    return A @ A.T + n * np.eye(n)
+
+
+def test_sample_bank_root_round_trip(tmp_path):
+    bank = SampleBank(300, seed=1, root=str(tmp_path))
+    key_a, key_b = bank.add_pair(_sigma(0), _sigma(1))
+    reopened = SampleBank(300, root=str(tmp_path))
+    assert reopened.seeds == bank.seeds
+    assert np.array_equal(reopened.samples(key_a), bank.samples(key_a))
+    # the cached distances give the same joint entropy as a neighbor search in the joint space
+    joint = np.concatenate((bank.samples(key_a), bank.samples(key_b))).T
+    assert np.isclose(reopened.joint_entropy([key_a, key_b], 3), entropy_estimation(joint, 3))
+
+
+def test_sample_bank_subset():
+    bank = SampleBank(200, seed=1)
+    keys = [bank.add(_sigma(seed)) for seed in range(5)]
+    subset = bank.subset(keys[:2])
+    assert sorted(subset.seeds) == sorted(keys[:2])
+    assert np.array_equal(subset.samples(keys[0]), bank.samples(keys[0]))
+    assert keys[2] not in subset
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from random_networks import ErdosRenyiNetwork
+from service import NetworkService, METRICS, request
+from toolkit import EncodedNetwork, infomation_divergence, mutual_infomation
+
+
+def _weighted(seed, n=30):
+    W = ErdosRenyiNetwork(n, 0.3, seed=seed) * np.random.default_rng(seed).uniform(1, 2, (n, n))
+    return np.triu(W, 1) + np.triu(W, 1).T
+
+
+def _start(service, **address):
+    # the service runs its event loop in a thread, the test talks to it through client.request
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(service.start(**address))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(service.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+    return stop
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = NetworkService(str(tmp_path / 'store'))
+    stop = _start(service, port=0)
+    yield service
+    stop()
+
+
+def test_service_divergence_and_mi(service):
+    W_a, W_b = _weighted(0), _weighted(1)
+    status, upload = request(service.address, 'POST', '/networks', W=W_a)
+    assert status == 200 and upload['n'] == 30
+    status, result = request(service.address, 'POST', '/metric',
+                             {'metric': 'divergence', 'a': upload['id'], 'b': {'W': W_b.tolist()}})
+    assert status == 200
+    assert np.allclose([result['d_ab'], result['d_ba']], infomation_divergence(EncodedNetwork(W_a), EncodedNetwork(W_b)))
+
+    params = {'sample_num': 300, 'k': 2, 'seed': 3}
+    status, result = request(service.address, 'POST', '/metric', {'metric': 'mi', 'a': upload['id'],
+                                                                  'b': result['b'], 'params': params})
+    assert status == 200
+    assert np.allclose(result['i_ab'], mutual_infomation(EncodedNetwork(W_a), EncodedNetwork(W_b), 300, 2, seed=3)[3])
+    # the inverse of Sigma is computed for the divergence only
+    _, only_mi = request(service.address, 'POST', '/metric', {'metric': 'mi', 'a': {'W': _weighted(4).tolist()},
+                                                              'b': result['b'], 'params': params})
+    assert 'inv' not in service.cache.get(only_mi['a']).__dict__
+
+    status, result = request(service.address, 'POST', '/metric', {'metric': 'divergence', 'a': 'unknown', 'b': 'x'})
+    assert status == 404
+
+
+def test_service_coalesces_identical_requests(service, monkeypatch):
+    calls = []
+
+    def slow(network_a, network_b, params):
+        calls.append(params)
+        time.sleep(0.5)
+        return {'value': 1.0}
+    monkeypatch.setitem(METRICS, 'slow', slow)
+
+    _, upload = request(service.address, 'POST', '/networks', W=_weighted(2))
+    payload = {'metric': 'slow', 'a': upload['id'], 'b': upload['id']}
+    with ThreadPoolExecutor(4) as executor:
+        responses = list(executor.map(lambda _: request(service.address, 'POST', '/metric', payload), range(4)))
+    assert all(status == 200 and result['value'] == 1.0 for status, result in responses)
+    assert len(calls) == 1
+    assert request(service.address, 'GET', '/stats')[1]['coalesced'] >= 3
+
+
+def test_service_cache_eviction(tmp_path):
+    # the budget holds one encoded network, evicted ones are encoded again from the store
+    service = NetworkService(str(tmp_path / 'store'), max_cache_bytes=40000)
+    path = str(tmp_path / 'service.sock')
+    stop = _start(service, path=path)
+    try:
+        ids = [request(path, 'POST', '/networks', W=_weighted(seed))[1]['id'] for seed in range(3)]
+        status, result = request(path, 'POST', '/metric', {'metric': 'divergence', 'a': ids[1], 'b': ids[2]})
+        assert status == 200
+        stats = request(path, 'GET', '/stats')[1]['cache']
+        assert stats['evictions'] >= 2 and ids[0] not in service.cache
+        status, again = request(path, 'POST', '/metric', {'metric': 'divergence', 'a': ids[0], 'b': ids[2]})
+        assert status == 200 and np.isfinite(again['d_ab'])
+    finally:
+        stop()
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from random_networks import ErdosRenyiNetwork
+from toolkit import EncodedNetwork, infomation_divergence, stochastic_infomation_divergence, lanczos_quadrature
+
+
+def _weighted(seed, n=60):
+    W = ErdosRenyiNetwork(n, 0.2, seed=seed) * np.random.default_rng(seed).uniform(1, 2, (n, n))
+    return np.triu(W, 1) + np.triu(W, 1).T
+
+
+def test_lanczos_quadrature_is_exact_with_n_steps():
+    network = EncodedNetwork(_weighted(0, 30))
+    sigma = network.sigma
+    eigvals, eigvecs = np.linalg.eigh(sigma)
+    v = np.random.default_rng(1).standard_normal(30)
+    exact = np.dot(v, eigvecs @ (np.log(eigvals) * (eigvecs.T @ v)))
+    assert np.isclose(lanczos_quadrature(lambda x: sigma @ x, v, 30), exact)
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+def test_stochastic_divergence_matches_dense_value(sparse):
+    W_a, W_b = _weighted(2), _weighted(3)
+    exact = infomation_divergence(EncodedNetwork(W_a), EncodedNetwork(W_b))
+    if sparse:
+        W_a, W_b = sp.csr_matrix(W_a), sp.csr_matrix(W_b)
+    d_ab, d_ba, d_ab_error, d_ba_error = stochastic_infomation_divergence(
+        EncodedNetwork(W_a), EncodedNetwork(W_b), probe_num=200, lanczos_steps=60, seed=4)
+    # the probe means are within a few standard errors of the exact divergences
+    assert abs(d_ab - exact[0]) <= 4 * d_ab_error and abs(d_ba - exact[1]) <= 4 * d_ba_error
+    assert d_ab_error < 0.1 * exact[0] and d_ba_error < 0.1 * exact[1]
@@ -0,0 +1,45 @@
+import os
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from random_networks import ErdosRenyiNetwork
+from toolkit import EncodedNetwork, NetworkStore
+
+
+def _weighted(seed, n=20):
+    W = ErdosRenyiNetwork(n, 0.4, seed=seed) * np.random.default_rng(seed).uniform(1, 2, (n, n))
+    return np.triu(W, 1) + np.triu(W, 1).T
+
+
+def test_store_round_trip(tmp_path):
+    store = NetworkStore(str(tmp_path))
+    network = EncodedNetwork(_weighted(0))
+    store.put('a', network, arrays=('L', 'sigma', 'cholesky', 'inv', 'logdet'))
+    for mmap in (True, False):
+        stored = store.get('a', mmap)
+        for key in ('W', 'L', 'sigma', 'cholesky', 'inv'):
+            assert np.array_equal(getattr(stored, key), getattr(network, key))
+        assert stored.logdet == network.logdet
+    assert store.names() == ['a'] and 'a' in store
+    store.remove('a')
+    assert store.names() == [] and 'a' not in store
+
+
+def test_store_put_removes_previous_arrays(tmp_path):
+    store = NetworkStore(str(tmp_path))
+    store.put('a', sp.csr_matrix(_weighted(1)), arrays=('L', 'logdet'))
+    store.put('a', _weighted(1), arrays=('sigma', 'logdet'))
+    assert sorted(os.listdir(str(tmp_path / 'a'))) == ['W.npy', 'entry.json', 'sigma.npy']
+    assert np.array_equal(store.get('a').W, _weighted(1))
+
+
+@pytest.mark.parametrize('name', ['..', '.', '../outside', 'a/b', '', '.hidden', 'a\\b'])
+def test_store_rejects_names_outside_the_root(tmp_path, name):
+    store = NetworkStore(str(tmp_path / 'store'))
+    with pytest.raises(ValueError):
+        store.put(name, _weighted(2))
+    with pytest.raises(ValueError):
+        store.get(name)
+    assert os.listdir(str(tmp_path)) == ['store']
@@ -0,0 +1,14 @@
+import numpy as np
+
+from random_networks import ErdosRenyiNetwork
+from toolkit import EncodedNetwork, graph_laplacian, generate_random_variable
+
+
+def test_graph_laplacian_boolean_adjacency():
+    G = ErdosRenyiNetwork(30, 0.3, seed=0) > 0
+    L = graph_laplacian(G)
+    assert L.dtype == np.float64
+    assert np.allclose(L, np.diag(np.sum(G, axis=0)) - G)
+    _, _, sigma = generate_random_variable(G)
+    assert np.allclose(sigma, generate_random_variable(G.astype(float))[2])
+    assert np.isfinite(EncodedNetwork(G).logdet)
@@ -1,7 +1,23 @@
+__version__ = '0.1.0'
+
 from .utils import pseudoinverse, generate_random_variable, convert_to_symmetric_with_zero_diagonal, \
-    multivar_gaussian_rand_num_generator
-from .info_divergence import infomation_divergence
+    multivar_gaussian_rand_num_generator, graph_laplacian, entropy_estimation, iter_sigma_ensemble
+from .entropy_estimators import register_entropy_estimator, get_entropy_estimator, ENTROPY_ESTIMATORS, \
+    IncrementalChebyshevKNN
+from .encoded_network import EncodedNetwork, as_encoded_network
+from .sparse_encoding import GroundedLaplacianSolver, SparsePseudoinverse, SparseSigma
+from .sampling import GaussianSampler, default_sampler, content_hash
+from .store import NetworkStore
+from .sample_bank import SampleBank
+from .result_cache import ResultCache, memoize
+from .profiling import profile, span, Profiler, register_span_callback, unregister_span_callback
+from .info_divergence import infomation_divergence, pairwise_divergence
+from .stochastic import stochastic_infomation_divergence, lanczos_quadrature
 from .mutual_info import mutual_infomation
+from .adaptive import adaptive_mutual_infomation, adaptive_granger_causality_and_transfer_entropy, \
+    confidence_half_width
 from .fisher_info import fisher_information
-from .causality import granger_causality_and_transfer_entropy
+from .causality import granger_causality_and_transfer_entropy, iter_granger_causality_and_transfer_entropy
 from .network_approximation import network_approximation
+from .network_index import SpectralIndex, divergence_lower_bound
+from .incremental import IncrementalNetwork, DivergenceTracker
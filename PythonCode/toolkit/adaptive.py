@@ -0,0 +1,150 @@
+import numpy as np
+from scipy.stats import t as student_t
+
+from .encoded_network import as_encoded_network
+from .entropy_estimators import IncrementalChebyshevKNN
+from .sampling import default_sampler
+from .causality import iter_granger_causality_and_transfer_entropy
+from .parallel import resolve_seed_sequence
+from .profiling import span
+
+
+def confidence_half_width(values, confidence=0.95):
+    """
+    Input:
+    values: independent replicates of an estimate
+    confidence: the confidence level of the interval
+
+    Output:
+    the half-width of the Student t confidence interval of the mean of values
+    """
+    values = np.asarray(values)
+    if values.shape[0] < 2:
+        return np.inf
+    return student_t.ppf(0.5 + confidence / 2, values.shape[0] - 1) * np.std(values, ddof=1) / np.sqrt(values.shape[0])
+
+
+def adaptive_mutual_infomation(sigma_a, sigma_b, k, ci_width, initial_sample_num=500, sample_increment=None,
+                               max_sample_num=20000, replicate_num=4, confidence=0.95, seed=None, max_memory=2**28):
+    """
+    Mutual information with as many samples as needed for a target confidence
+    interval. h_a and h_b are exact, h_ab is estimated by replicate_num independent
+    replicates of the Chebyshev KNN estimator, whose samples grow by
+    sample_increment until the confidence interval of their mean is narrower than
+    ci_width or max_sample_num is reached. The samples and the KNN radii of a
+    replicate are kept and updated as it grows, instead of being redrawn.
+
+    The interval covers the Monte Carlo variance of h_ab; the bias of the KNN
+    estimator, which shrinks as the samples grow, is not included.
+
+    Input:
+    sigma_a: the covariance matrix Sigma of network a, or its EncodedNetwork
+    sigma_b: the covariance matrix Sigma of network b, or its EncodedNetwork
+    k: the number of nearest neighbors in KNN-based entropy estimation
+    ci_width: the target width of the confidence interval of the mutual information
+    initial_sample_num: the number of samples per replicate before the first check
+    sample_increment: the number of samples added per replicate at every step,
+        initial_sample_num if None
+    max_sample_num: the maximal number of samples per replicate
+    replicate_num: the number of independent replicates, at least 2
+    confidence: the confidence level of the interval
+    seed: None, an int or a SeedSequence, the global numpy random state is used if
+        None, see resolve_seed_sequence
+    max_memory: the memory budget of the distance blocks of every replicate, in bytes
+
+    Output:
+    h_a, h_b, h_ab, mi: as in mutual_infomation, h_ab being the replicate mean
+    half_width: the half-width of the achieved confidence interval of mi
+    sample_num: the number of samples per replicate used
+    """
+    assert replicate_num >= 2, 'The confidence interval needs at least 2 replicates'
+    network_a = as_encoded_network(sigma_a)
+    network_b = as_encoded_network(sigma_b)
+    n_a, n_b = network_a.shape[0], network_b.shape[0]
+    sample_increment = initial_sample_num if sample_increment is None else sample_increment
+
+    h_a = max((1.0 + np.log(2 * np.pi)) * n_a / 2.0 + network_a.logdet / 2.0, 0.0)
+    h_b = max((1.0 + np.log(2 * np.pi)) * n_b / 2.0 + network_b.logdet / 2.0, 0.0)
+
+    seed_sequence = resolve_seed_sequence(seed)
+    rngs = [np.random.default_rng(child) for child in seed_sequence.spawn(replicate_num)]
+    replicates = [IncrementalChebyshevKNN(k, max_memory) for _ in range(replicate_num)]
+
+    sample_num, increment = 0, initial_sample_num
+    while True:
+        increment = min(increment, max_sample_num - sample_num)
+        with span('adaptive_mi_step', sample_num=sample_num + increment, replicate_num=replicate_num):
+            for rng, replicate in zip(rngs, replicates):
+                joint = np.empty((n_a + n_b, increment))
+                default_sampler.sample(network_a, increment, rng, out=joint[:n_a])
+                default_sampler.sample(network_b, increment, rng, out=joint[n_a:])
+                replicate.add(joint.T)
+        sample_num += increment
+        h_ab_replicates = [replicate.entropy() for replicate in replicates]
+        half_width = confidence_half_width(h_ab_replicates, confidence)
+        if 2 * half_width <= ci_width or sample_num >= max_sample_num:
+            break
+        increment = sample_increment
+
+    h_ab = np.mean(h_ab_replicates)
+    mi = np.min([np.max([h_a + h_b - h_ab, 0]), h_a, h_b])
+    return h_a, h_b, h_ab, mi, half_width, sample_num
+
+
+def adaptive_granger_causality_and_transfer_entropy(sigma_a, sigma_b, sample_num, k, ci_width,
+                                                    initial_partition_num=5, partition_increment=5,
+                                                    max_partition_num=100, confidence=0.95, seed=None, n_jobs=None,
+                                                    entropy_method='knn', entropy_options=None, dtype=None):
+    """
+    Granger causality and transfer entropy with as many random partitions as needed
+    for a target confidence interval. Partitions are added partition_increment at
+    a time until the confidence intervals of both averages are narrower than
+    ci_width, or max_partition_num is reached. The new partitions are the next
+    children of SeedSequence(seed), so partition i has the same value as in
+    granger_causality_and_transfer_entropy with the same seed, and the networks
+    are factorized once for all the steps.
+
+    Input:
+    sigma_a, sigma_b, sample_num, k, seed, n_jobs, entropy_method, entropy_options,
+        dtype: see granger_causality_and_transfer_entropy
+    ci_width: the target width of the confidence intervals of both averages
+    initial_partition_num: the number of random partitions before the first check
+    partition_increment: the number of random partitions added at every step
+    max_partition_num: the maximal number of random partitions
+    confidence: the confidence level of the intervals
+
+    Output:
+    granger_causality_ab_vec, granger_causality_ab, transfer_entropy_ab_vec,
+        transfer_entropy_ab, size_ab_vec: as in granger_causality_and_transfer_entropy
+    granger_causality_half_width: the half-width of the confidence interval of granger_causality_ab
+    transfer_entropy_half_width: the half-width of the confidence interval of transfer_entropy_ab
+    """
+    network_a = as_encoded_network(sigma_a)
+    network_b = as_encoded_network(sigma_b)
+    seed_sequence = resolve_seed_sequence(seed)
+
+    size_ab_vec, granger_causality_ab_vec, transfer_entropy_ab_vec = [], [], []
+    increment = initial_partition_num
+    while True:
+        increment = min(increment, max_partition_num - len(size_ab_vec))
+        # every call spawns the next children of seed_sequence
+        results = sorted(iter_granger_causality_and_transfer_entropy(
+            network_a, network_b, sample_num, increment, k, seed_sequence, n_jobs, entropy_method, entropy_options,
+            dtype))
+        for _, size_ab, granger_causality_ab, transfer_entropy_ab in results:
+            size_ab_vec.append(size_ab)
+            granger_causality_ab_vec.append(granger_causality_ab)
+            transfer_entropy_ab_vec.append(transfer_entropy_ab)
+
+        granger_causality_half_width = confidence_half_width(granger_causality_ab_vec, confidence)
+        transfer_entropy_half_width = confidence_half_width(transfer_entropy_ab_vec, confidence)
+        if 2 * max(granger_causality_half_width, transfer_entropy_half_width) <= ci_width \
+                or len(size_ab_vec) >= max_partition_num:
+            break
+        increment = partition_increment
+
+    granger_causality_ab_vec = np.real(np.array(granger_causality_ab_vec))
+    transfer_entropy_ab_vec = np.array(transfer_entropy_ab_vec)
+    return granger_causality_ab_vec, np.mean(granger_causality_ab_vec), transfer_entropy_ab_vec, \
+        np.mean(transfer_entropy_ab_vec), np.array(size_ab_vec, dtype=int), \
+        granger_causality_half_width, transfer_entropy_half_width
@@ -1,19 +1,182 @@
-import random
 import numpy as np
 
-from .utils import multivar_gaussian_rand_num_generator, entropy_estimation
+from .utils import entropy_estimation
+from .encoded_network import as_encoded_network
+from .parallel import imap_unordered, resolve_seed_sequence
+from .sampling import default_sampler
+from .profiling import span
 
 
-def granger_causality_and_transfer_entropy(sigma_a, sigma_b, sample_num, rand_partition_num, k):
+def _causality_partition(state, task):
+    """
+    compute Granger causality and transfer entropy for one random partition of
+    network B, drawing everything random from the generator of the partition
+    """
+    i, seed_sequence = task
+    with span('causality_partition', i=i, n=state['network_b'].shape[0], sample_num=state['sample_num']):
+        return _causality_partition_values(state, i, seed_sequence)
+
+
+def _causality_partition_values(state, i, seed_sequence):
+    network_a, network_b = state['network_a'], state['network_b']
+    sample_num, k, h_b = state['sample_num'], state['k'], state['h_b']
+    entropy_method, entropy_options = state['entropy_method'], state['entropy_options']
+    sample_bank = state['sample_bank']
+    rng = np.random.default_rng(seed_sequence)
+    sigma_b = network_b.sigma
+
+    random_node = rng.permutation(sigma_b.shape[0])
+    size_ab = int(rng.integers(1, sigma_b.shape[0]))
+    b1, b2 = random_node[:size_ab], random_node[size_ab:]
+    subnet_b1 = sigma_b[np.ix_(b1, b1)]
+    subnet_b2 = sigma_b[np.ix_(b2, b2)]
+
+    # transfer entropy
+    if sample_bank is not None:
+        # the samples of b1 are rows of the banked samples of b, and h_ab is shared by all partitions
+        key_a, key_b = state['sample_keys']
+        samples_b1_a = np.concatenate((sample_bank.samples(key_b)[b1], sample_bank.samples(key_a))).T
+        h_a_sb1 = sample_bank.joint_entropy([(key_b, b1), key_a], k, entropy_method, **entropy_options)
+        h_sb1 = sample_bank.joint_entropy([(key_b, b1)], k, entropy_method, **entropy_options)
+        h_ab = state['h_ab']
+    else:
+        samples_b1_a, h_a_sb1, h_sb1, h_ab = _sampled_entropies(state, rng, b1)
+    transfer_entropy_ab = h_b + h_a_sb1 - h_sb1 - h_ab
+
+    # granger causality
+    sigma_1 = subnet_b1 - np.matmul(np.matmul(sigma_b[np.ix_(b1, b2)], np.linalg.inv(subnet_b2)),
+                                    sigma_b[np.ix_(b2, b1)])
+    samples_b2 = default_sampler.sample(network_b, sample_num, rng, index=b2, dtype=samples_b1_a.dtype).T
+    with span('covariance', n=sample_num, dim=samples_b2.shape[1] + samples_b1_a.shape[1]):
+        cov_b2_b1_a = np.cov(samples_b2.T, samples_b1_a.T)[:samples_b2.shape[1],samples_b2.shape[1]:]
+        cov_b1_a = np.cov(samples_b1_a.T)
+    sigma_2 = subnet_b2 - np.dot(np.dot(cov_b2_b1_a, np.linalg.inv(cov_b1_a)), cov_b2_b1_a.T)
+    with span('eigvals', n=sigma_1.shape[0] + sigma_2.shape[0]):
+        eigvals_sigma_1 = np.linalg.eigvals(sigma_1)
+        eigvals_sigma_1[eigvals_sigma_1 <= 0] = 1
+        eigvals_sigma_2 = np.linalg.eigvals(sigma_2)
+        eigvals_sigma_2[eigvals_sigma_2 <= 0] = 1
+    granger_causality_ab = np.sum(np.log(eigvals_sigma_1)) - np.sum(np.log(eigvals_sigma_2))
+
+    return i, size_ab, granger_causality_ab, transfer_entropy_ab
+
+
+def _sampled_entropies(state, rng, b1):
+    network_a, network_b = state['network_a'], state['network_b']
+    sample_num, k = state['sample_num'], state['k']
+    entropy_method, entropy_options = state['entropy_method'], state['entropy_options']
+    dtype = state['dtype']
+    size_ab = b1.shape[0]
+
+    # samples of the sub-blocks of Sigma_b are rows of samples drawn with the factor of Sigma_b;
+    # the samples are drawn into the rows [b1; a; b] of one buffer, so that the joint samples
+    # of (b1, a) and of (a, b) are contiguous row blocks of it instead of concatenated copies
+    n_a = network_a.shape[0]
+    samples = np.empty((size_ab + n_a + network_b.shape[0], sample_num), dtype=dtype or default_sampler.dtype)
+    sample_b1 = samples[:size_ab]
+    sample_a = samples[size_ab:size_ab+n_a]
+    default_sampler.sample(network_a, sample_num, rng, out=sample_a)
+    default_sampler.sample(network_b, sample_num, rng, index=b1, out=sample_b1)
+    # the Chebyshev distance does not depend on the order of the coordinates
+    samples_b1_a = samples[:size_ab+n_a].T
+    h_a_sb1 = entropy_estimation(samples_b1_a, k, entropy_method, **entropy_options)
+
+    h_sb1 = entropy_estimation(sample_b1.T, k, entropy_method, **entropy_options)
+
+    default_sampler.sample(network_b, sample_num, rng, out=samples[size_ab+n_a:])
+    h_ab = entropy_estimation(samples[size_ab:].T, k, entropy_method, **entropy_options)
+    return samples_b1_a, h_a_sb1, h_sb1, h_ab
+
+
+def iter_granger_causality_and_transfer_entropy(sigma_a, sigma_b, sample_num, rand_partition_num, k,
+                                                seed=None, n_jobs=None, entropy_method='knn', entropy_options=None,
+                                                dtype=None, sample_bank=None):
+    """
+    compute Granger causality and transfer entropy from network A to network B for
+    every random partition of network B, yielding the partitions as they finish
+
+    Partition i draws its partition and samples from its own generator, spawned
+    from SeedSequence(seed), so for a fixed seed the value of every partition is
+    the same whatever n_jobs is.
+
+    Input:
+    sigma_a: the covariance matrix Sigma of network a, or its EncodedNetwork
+    sigma_b: the covariance matrix Sigma of network b, or its EncodedNetwork
+    sample_num: the number of samples in random sample generation
+    random_p_num: the number of repetitions of random partition
+    k: the number of nearest neighbors in KNN-based entropy estimation
+    seed: None, an int or a SeedSequence, the global numpy random state is used if
+        None, see resolve_seed_sequence
+    n_jobs: the number of worker processes, None for serial
+    entropy_method: the entropy estimator of the samples, see entropy_estimation
+    entropy_options: a dict of keyword arguments of the entropy estimator
+    dtype: the dtype of the samples, e.g. np.float32 to halve their memory, the
+        dtype of toolkit.sampling.default_sampler if None
+    sample_bank: a SampleBank of sample_num samples per network; the samples of a,
+        b and b1 used by the transfer entropy are then taken from the bank, the
+        joint entropy of (a, b) is estimated once for all partitions, and only the
+        partitions and the samples of b2 in the Granger covariance are drawn from
+        the generators of the partitions
+
+    Output:
+    an iterator over (i, size_ab, granger_causality_ab, transfer_entropy_ab) for
+    the partitions i in completion order
+    """
+
+    network_a = as_encoded_network(sigma_a)
+    network_b = as_encoded_network(sigma_b)
+    # factorize once here, so that worker processes receive the factors
+    network_a.cholesky
+    network_b.cholesky
+
+    sample_keys, h_ab = None, None
+    if sample_bank is not None:
+        assert sample_bank.sample_num == sample_num, 'The bank holds {} samples per network'.format(
+            sample_bank.sample_num)
+        sample_keys = sample_bank.add_pair(network_a, network_b)
+        h_ab = sample_bank.joint_entropy(list(sample_keys), k, entropy_method, **(entropy_options or {}))
+
+    # transfer entropy
+    h_b = network_b.shape[0] * 0.5 * (1 + np.log(2*np.pi)) + 0.5 * network_b.logdet
+
+    state = {
+        'network_a': network_a,
+        'network_b': network_b,
+        'h_b': h_b,
+        'sample_num': sample_num,
+        'k': k,
+        'entropy_method': entropy_method,
+        'entropy_options': entropy_options or {},
+        'dtype': dtype,
+        # workers receive the samples of a and b only
+        'sample_bank': None if sample_bank is None else sample_bank.subset(sample_keys),
+        'sample_keys': sample_keys,
+        'h_ab': h_ab,
+    }
+    seed_sequence = resolve_seed_sequence(seed)
+    tasks = enumerate(seed_sequence.spawn(rand_partition_num))
+    return imap_unordered(_causality_partition, tasks, n_jobs, state)
+
+
+def granger_causality_and_transfer_entropy(sigma_a, sigma_b, sample_num, rand_partition_num, k,
+                                           seed=None, n_jobs=None, entropy_method='knn', entropy_options=None,
+                                           dtype=None, sample_bank=None):
     """
     compute Granger causality and transfer entropy from network A to network B
 
     Input:
-    sigma_a: the covariance matrix Sigma of network a
-    sigma_b: the covariance matrix Sigma of network b
+    sigma_a: the covariance matrix Sigma of network a, or its EncodedNetwork
+    sigma_b: the covariance matrix Sigma of network b, or its EncodedNetwork
     sample_num: the number of samples in random sample generation
     random_p_num: the number of repetitions of random partition
     k: the number of nearest neighbors in KNN-based entropy estimation
+    seed: None, an int or a SeedSequence, results are reproducible for a fixed seed,
+        or after np.random.seed(...) if None
+    n_jobs: the number of worker processes sharing the random partitions, None for serial
+    entropy_method: the entropy estimator of the samples, see entropy_estimation
+    entropy_options: a dict of keyword arguments of the entropy estimator
+    dtype: the dtype of the samples, see iter_granger_causality_and_transfer_entropy
+    sample_bank: a SampleBank reused across pairs, see iter_granger_causality_and_transfer_entropy
 
     Output:
     granger_causality_ab_vec: the vector of Granger causality values from network A to 
@@ -27,43 +190,12 @@ def granger_causality_and_transfer_entropy(sigma_a, sigma_b, sample_num, rand_pa
     size_ab_vec = np.zeros(rand_partition_num, dtype=int)
     granger_causality_ab_vec = np.zeros(rand_partition_num)
     transfer_entropy_ab_vec = np.zeros(rand_partition_num)
-    for i in range(rand_partition_num):
-        random_node = np.random.permutation(sigma_b.shape[0])
-        size_ab_vec[i] = random.randint(1, sigma_b.shape[0]-1)
-        subnet_b1 = sigma_b[random_node[:size_ab_vec[i]]][:, random_node[:size_ab_vec[i]]]
-        subnet_b2 = sigma_b[random_node[size_ab_vec[i]:]][:, random_node[size_ab_vec[i]:]]
-
-        # transfer entropy
-        detnet_b = np.sum(np.log(np.linalg.eigvals(sigma_b)))
-        h_b = sigma_b.shape[0] * 0.5 * (1 + np.log(2*np.pi)) + 0.5 * detnet_b
-        
-        sample_a, _ = multivar_gaussian_rand_num_generator(np.zeros(sigma_a.shape[0]), sigma_a, sample_num)
-        sample_b1, _ = multivar_gaussian_rand_num_generator(np.zeros(subnet_b1.shape[0]), subnet_b1, sample_num)
-        joint_samples = np.concatenate((sample_a, sample_b1), axis=0).T
-        h_a_sb1 = entropy_estimation(joint_samples, k)
-
-        h_sb1 = entropy_estimation(sample_b1.T, k)
-
-        sample_b, _ = multivar_gaussian_rand_num_generator(np.zeros(sigma_b.shape[0]), sigma_b, sample_num)
-        joint_samples = np.concatenate((sample_a, sample_b), axis=0).T
-        h_ab = entropy_estimation(joint_samples, k)
-
-        transfer_entropy_ab_vec[i] = h_b + h_a_sb1 - h_sb1 - h_ab
-
-        # granger causality
-        sigma_1 = subnet_b1 - np.matmul(np.matmul(sigma_b[random_node[:size_ab_vec[i]]][:, random_node[size_ab_vec[i]:]],
-            np.linalg.inv(subnet_b2)) , sigma_b[random_node[size_ab_vec[i]:]][:, random_node[:size_ab_vec[i]]])
-        samples_b1_a = np.concatenate((sample_b1, sample_a), axis=0).T
-        samples_b2, _ = multivar_gaussian_rand_num_generator(np.zeros(subnet_b2.shape[0]), subnet_b2, sample_num)
-        samples_b2 = samples_b2.T
-        cov_b2_b1_a = np.cov(samples_b2.T, samples_b1_a.T)[:samples_b2.shape[1],samples_b2.shape[1]:]
-        cov_b1_a = np.cov(samples_b1_a.T)
-        sigma_2 = subnet_b2 - np.dot(np.dot(cov_b2_b1_a, np.linalg.inv(cov_b1_a)), cov_b2_b1_a.T)
-        eigvals_sigma_1 = np.linalg.eigvals(sigma_1)
-        eigvals_sigma_1[eigvals_sigma_1 <= 0] = 1
-        eigvals_sigma_2 = np.linalg.eigvals(sigma_2)
-        eigvals_sigma_2[eigvals_sigma_2 <= 0] = 1
-        granger_causality_ab_vec[i] = np.sum(np.log(eigvals_sigma_1)) - np.sum(np.log(eigvals_sigma_2))
+    for i, size_ab, granger_causality_ab, transfer_entropy_ab in iter_granger_causality_and_transfer_entropy(
+            sigma_a, sigma_b, sample_num, rand_partition_num, k, seed, n_jobs, entropy_method, entropy_options,
+            dtype, sample_bank):
+        size_ab_vec[i] = size_ab
+        granger_causality_ab_vec[i] = granger_causality_ab
+        transfer_entropy_ab_vec[i] = transfer_entropy_ab
 
     transfer_entropy_ab = np.mean(transfer_entropy_ab_vec)
     granger_causality_ab = np.mean(granger_causality_ab_vec)
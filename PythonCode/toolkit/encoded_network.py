@@ -0,0 +1,158 @@
+from functools import cached_property
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.linalg import cho_solve
+
+from .utils import graph_laplacian, pseudoinverse
+from .sparse_encoding import GroundedLaplacianSolver, SparsePseudoinverse, SparseSigma
+from .profiling import span
+
+
+class EncodedNetwork(object):
+    """
+    A network represented by a Gaussian variable. The graph Laplacian, its
+    pseudoinverse, the covariance matrix Sigma and the factorizations of Sigma
+    are computed lazily, at most once per network, so that every toolkit
+    function applied to the same network shares them.
+
+    Input:
+    W: the weighted adjacent matrix
+    take_pseudoinverse: whether to take the pseudoinverse of the graph Laplacian
+    graph_type: the type of the graph Laplacian, 'undirected' or 'directed_in' or 'directed_out' or 'directed_symmetric'
+    normalize: whether to use the random-walk normalized Laplacian
+    sparse_solver: 'direct' or 'cg', the GroundedLaplacianSolver method of a sparse network
+
+    Attributes:
+    L: the graph Laplacian
+    PinvL: the Moore-Penrose pseudoinverse of L
+    sigma: the covariance matrix of Gaussian variable
+    cholesky: the lower Cholesky factor of sigma, sigma = cholesky * cholesky'
+    inv: the inverse of sigma
+    eigvals: the eigenvalues of sigma
+    logdet: the log-determinant of sigma
+
+    If W is a scipy.sparse matrix, L stays sparse and PinvL and sigma are the
+    SparsePseudoinverse and SparseSigma operators sharing one sparse factorization.
+    Such a network supports solve and logdet, but not the dense cholesky, inv and
+    eigvals.
+    """
+
+    def __init__(self, W, take_pseudoinverse=False, graph_type='undirected', normalize=False, sparse_solver='direct'):
+        self.W = W
+        self.take_pseudoinverse = take_pseudoinverse
+        self.graph_type = graph_type
+        self.normalize = normalize
+        self.sparse_solver = sparse_solver
+
+    @classmethod
+    def from_sigma(cls, sigma):
+        """
+        Wrap an already computed covariance matrix Sigma, or a SparseSigma operator.
+        L and PinvL are not available for a dense Sigma.
+        """
+        if isinstance(sigma, SparseSigma):
+            network = cls(None, sigma.take_pseudoinverse)
+            network.__dict__['L'] = sigma.L
+            network.__dict__['sigma'] = sigma
+            return network
+        network = cls(None)
+        network.__dict__['sigma'] = np.asarray(sigma)
+        return network
+
+    @property
+    def shape(self):
+        return self.sigma.shape
+
+    @property
+    def is_sparse(self):
+        if self.W is None:
+            return isinstance(self.__dict__.get('sigma'), SparseSigma)
+        return sp.issparse(self.W)
+
+    @cached_property
+    def L(self):
+        assert self.W is not None, 'The network was built from Sigma, its Laplacian is unknown'
+        return graph_laplacian(self.W, self.graph_type, self.normalize)
+
+    @cached_property
+    def PinvL(self):
+        if self.is_sparse:
+            return SparsePseudoinverse(self.L, solver=self.sigma.solver)
+        return pseudoinverse(self.L)
+
+    @cached_property
+    def sigma(self):
+        if self.is_sparse:
+            return SparseSigma(self.L, self.take_pseudoinverse,
+                               solver=GroundedLaplacianSolver(self.L, self.sparse_solver))
+        if self.take_pseudoinverse:
+            return self.PinvL + 1.0 / self.L.shape[0]
+        return self.L + 1.0 / self.L.shape[0]
+
+    @cached_property
+    def is_symmetric(self):
+        if self.is_sparse:
+            return True
+        return np.linalg.norm(self.sigma - self.sigma.T) < 1e-8
+
+    @cached_property
+    def cholesky(self):
+        assert not self.is_sparse, 'The dense Cholesky factor is not available for a sparse network'
+        assert self.is_symmetric, 'The covariance matrix is not symmetric, norm: {}'.format(
+            np.linalg.norm(self.sigma - self.sigma.T))
+        with span('cholesky', n=self.sigma.shape[0]):
+            try:
+                return np.linalg.cholesky(self.sigma)
+            except np.linalg.LinAlgError:
+                return np.linalg.cholesky(self.sigma + np.eye(self.sigma.shape[0]) * 1e-8)
+
+    @cached_property
+    def inv(self):
+        assert not self.is_sparse, 'The dense inverse is not available for a sparse network, use solve'
+        cholesky = self.cholesky if self.is_symmetric else None
+        with span('inverse', n=self.sigma.shape[0]):
+            if cholesky is not None:
+                return cho_solve((cholesky, True), np.eye(self.sigma.shape[0]), overwrite_b=True)
+            return np.linalg.inv(self.sigma)
+
+    @cached_property
+    def eigvals(self):
+        assert not self.is_sparse, 'The eigenvalues are not available for a sparse network, use logdet'
+        with span('eigvals', n=self.sigma.shape[0]):
+            if self.is_symmetric:
+                return np.linalg.eigvalsh(self.sigma)
+            return np.linalg.eigvals(self.sigma)
+
+    @cached_property
+    def logdet(self):
+        if self.is_sparse:
+            with span('logdet', n=self.shape[0], sparse=True):
+                return self.sigma.logdet()
+        if self.is_symmetric:
+            return 2.0 * np.sum(np.log(np.diag(self.cholesky)))
+        return np.real(np.sum(np.log(self.eigvals.astype(complex))))
+
+    def solve(self, b):
+        """
+        Input:
+        b: n or n*k right-hand side
+
+        Output:
+        x: inv(sigma) b
+        """
+        if self.is_sparse:
+            return self.sigma.solve(b)
+        if self.is_symmetric:
+            return cho_solve((self.cholesky, True), b)
+        return np.linalg.solve(self.sigma, b)
+
+
+def as_encoded_network(sigma):
+    """
+    Return sigma unchanged if it is already an EncodedNetwork, otherwise wrap
+    the covariance matrix so that its factorizations are computed only once.
+    """
+    if isinstance(sigma, EncodedNetwork):
+        return sigma
+    return EncodedNetwork.from_sigma(sigma)
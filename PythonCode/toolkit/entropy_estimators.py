@@ -0,0 +1,235 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.spatial.distance import cdist
+from scipy.special import psi
+from sklearn.neighbors import NearestNeighbors
+
+from .profiling import span
+
+
+ENTROPY_ESTIMATORS = {}
+
+
+def register_entropy_estimator(name):
+    """
+    Register func(joint_samples, k, **options) as the entropy estimator called name,
+    selectable through the entropy_method argument of the toolkit functions.
+    """
+    def decorator(func):
+        ENTROPY_ESTIMATORS[name] = func
+        return func
+    return decorator
+
+
+def get_entropy_estimator(name):
+    assert name in ENTROPY_ESTIMATORS, 'Unknown entropy estimator: {}, available: {}'.format(
+        name, sorted(ENTROPY_ESTIMATORS))
+    return ENTROPY_ESTIMATORS[name]
+
+
+def knn_entropy_from_radius(r, sample_num, dim, k):
+    """
+    Input:
+    r: the Chebyshev distance of every sample to its k-th nearest neighbor,
+        counting the sample itself
+    sample_num: the number of samples
+    dim: the dimension of the samples
+    k: the number of nearest neighbors
+
+    Output:
+    h: the KNN-based entropy estimate
+    """
+    return psi(sample_num) + psi(k) + dim * np.mean(np.log(r), dtype=np.float64)
+
+
+@register_entropy_estimator('knn')
+def knn_entropy(joint_samples, k, algorithm='auto', leaf_size=30, n_jobs=None):
+    """
+    KNN-based entropy estimation with sklearn NearestNeighbors under the Chebyshev metric
+
+    Input:
+    joint_samples: sample_num*dim matrix of samples
+    k: the number of nearest neighbors in KNN-based entropy estimation
+    algorithm: 'auto', 'ball_tree', 'kd_tree' or 'brute'
+    leaf_size: the leaf size of the trees
+    n_jobs: the number of parallel jobs of the neighbor search
+
+    Output:
+    h: the entropy estimate
+    """
+    with span('knn_query', n=joint_samples.shape[0], dim=joint_samples.shape[1], k=k, method='knn'):
+        nbrs = NearestNeighbors(n_neighbors=k, metric='chebyshev', algorithm=algorithm,
+                                leaf_size=leaf_size, n_jobs=n_jobs).fit(joint_samples)
+        distances, _ = nbrs.kneighbors(joint_samples)
+    r = np.max(distances, axis=1)
+    return knn_entropy_from_radius(r, joint_samples.shape[0], joint_samples.shape[1], k)
+
+
+def _chebyshev_distances(query_T, samples_T, out, work):
+    # max over the coordinates of |q_d - s_d|, accumulated in place in out
+    np.subtract(query_T[0][:, None], samples_T[0][None, :], out=out)
+    np.abs(out, out=out)
+    for d in range(1, query_T.shape[0]):
+        np.subtract(query_T[d][:, None], samples_T[d][None, :], out=work)
+        np.abs(work, out=work)
+        np.maximum(out, work, out=out)
+    return out
+
+
+def chebyshev_knn_radius(query, samples, k, max_memory=2**28, n_jobs=None, dtype=np.float64):
+    """
+    brute-force Chebyshev distance of every query point to its k-th nearest sample,
+    counting the query point itself if it is a sample, computed by blocks of query
+    rows so that at most max_memory bytes of distances are held at a time
+
+    Input:
+    query: q*dim matrix of query points
+    samples: sample_num*dim matrix of samples
+    k: the number of nearest neighbors
+    max_memory: the memory budget of the distance blocks, in bytes
+    n_jobs: the number of threads working on different blocks
+    dtype: the dtype of the distances; float64 uses scipy's cdist, other dtypes
+        (e.g. np.float32) accumulate the distances in two preallocated buffers
+        per thread
+
+    Output:
+    r: the vector of the k-th nearest neighbor distances of the query points
+    """
+    n_jobs = 1 if n_jobs is None else n_jobs
+    dtype = np.dtype(dtype)
+    blocked = dtype != np.float64
+    buffer_num = 2 if blocked else 1
+    chunk = max(1, int(max_memory // (buffer_num * dtype.itemsize * samples.shape[0] * n_jobs)))
+    starts = list(range(0, query.shape[0], chunk))
+    r = np.empty(query.shape[0], dtype=dtype)
+
+    if blocked:
+        query_T = np.ascontiguousarray(query.T, dtype=dtype)
+        samples_T = np.ascontiguousarray(samples.T, dtype=dtype)
+
+    def radius(worker):
+        if blocked:
+            out = np.empty((chunk, samples.shape[0]), dtype=dtype)
+            work = np.empty_like(out)
+        for start in starts[worker::n_jobs]:
+            stop = min(start + chunk, query.shape[0])
+            if blocked:
+                distances = _chebyshev_distances(query_T[:, start:stop], samples_T, out[:stop-start], work[:stop-start])
+            else:
+                distances = cdist(query[start:stop], samples, 'chebyshev')
+            distances.partition(k-1, axis=1)
+            r[start:stop] = distances[:, k-1]
+        return r
+
+    if n_jobs == 1:
+        return radius(0)
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        list(executor.map(radius, range(n_jobs)))
+    return r
+
+
+@register_entropy_estimator('chunked_chebyshev')
+def chunked_chebyshev_entropy(joint_samples, k, max_memory=2**28, n_jobs=None, dtype=np.float64):
+    """
+    KNN-based entropy estimation with a chunked brute-force Chebyshev neighbor
+    search, which avoids the tree construction that does not pay off for
+    high-dimensional samples and bounds the memory of the distance computation
+
+    Input:
+    joint_samples: sample_num*dim matrix of samples
+    k: the number of nearest neighbors in KNN-based entropy estimation
+    max_memory: the memory budget of the distance blocks, in bytes
+    n_jobs: the number of threads
+    dtype: the dtype of the distances, np.float32 halves the memory per block; the
+        logarithms of the radii are averaged in float64
+
+    Output:
+    h: the entropy estimate
+    """
+    with span('knn_query', n=joint_samples.shape[0], dim=joint_samples.shape[1], k=k, method='chunked_chebyshev'):
+        r = chebyshev_knn_radius(joint_samples, joint_samples, k, max_memory, n_jobs, dtype)
+    return knn_entropy_from_radius(r, joint_samples.shape[0], joint_samples.shape[1], k)
+
+
+@register_entropy_estimator('gaussian')
+def gaussian_entropy(joint_samples, k=None):
+    """
+    closed-form entropy of the Gaussian variable with the sample covariance of
+    joint_samples, for callers that accept the Gaussian assumption of the toolkit
+
+    Input:
+    joint_samples: sample_num*dim matrix of samples
+    k: unused, kept for a common signature
+
+    Output:
+    h: the entropy estimate
+    """
+    dim = joint_samples.shape[1]
+    with span('covariance', n=joint_samples.shape[0], dim=dim):
+        _, logdet = np.linalg.slogdet(np.atleast_2d(np.cov(joint_samples, rowvar=False)))
+    return dim * 0.5 * (1 + np.log(2*np.pi)) + 0.5 * logdet
+
+
+class IncrementalChebyshevKNN(object):
+    """
+    Chebyshev k-nearest-neighbor radii of a growing set of samples. For every
+    sample the k smallest distances to the samples seen so far (itself included)
+    are kept, so adding m samples to n costs the n*m and m*(n+m) new distances
+    only: the radii of the old samples can only shrink and are merged with their
+    distances to the new ones.
+
+    Input:
+    k: the number of nearest neighbors
+    max_memory: the memory budget of the distance blocks, in bytes
+    """
+
+    def __init__(self, k, max_memory=2**28):
+        self.k = k
+        self.max_memory = max_memory
+        self.samples = None
+        self.nearest = None
+
+    @property
+    def sample_num(self):
+        return 0 if self.samples is None else self.samples.shape[0]
+
+    def _chunk(self, columns):
+        return max(1, int(self.max_memory // (8 * columns)))
+
+    def add(self, new_samples):
+        """
+        Input:
+        new_samples: m*dim matrix of new samples; the first block needs m >= k
+        """
+        new_samples = np.asarray(new_samples, dtype=np.float64)
+        samples = new_samples if self.samples is None else np.concatenate((self.samples, new_samples))
+        assert samples.shape[0] >= self.k, 'At least k samples are needed'
+        old_num, k = self.sample_num, self.k
+
+        new_nearest = np.empty((new_samples.shape[0], k))
+        chunk = self._chunk(samples.shape[0])
+        for start in range(0, new_samples.shape[0], chunk):
+            distances = cdist(new_samples[start:start+chunk], samples, 'chebyshev')
+            new_nearest[start:start+chunk] = np.partition(distances, k-1, axis=1)[:, :k]
+
+        if old_num:
+            chunk = self._chunk(new_samples.shape[0] + k)
+            for start in range(0, old_num, chunk):
+                distances = np.concatenate((self.nearest[start:start+chunk],
+                                            cdist(self.samples[start:start+chunk], new_samples, 'chebyshev')), axis=1)
+                self.nearest[start:start+chunk] = np.partition(distances, k-1, axis=1)[:, :k]
+            self.nearest = np.concatenate((self.nearest, new_nearest))
+        else:
+            self.nearest = new_nearest
+        self.samples = samples
+
+    @property
+    def radius(self):
+        """
+        the distance of every sample to its k-th nearest sample, itself included
+        """
+        return np.max(self.nearest, axis=1)
+
+    def entropy(self):
+        return knn_entropy_from_radius(self.radius, self.samples.shape[0], self.samples.shape[1], self.k)
@@ -0,0 +1,200 @@
+import numpy as np
+
+from .utils import generate_random_variable
+from .encoded_network import EncodedNetwork, as_encoded_network
+
+
+class IncrementalNetwork(object):
+    """
+    A dense undirected network whose encoding is updated in O(n^2) per edge change
+    instead of being recomputed in O(n^3).
+
+    Changing the weight of edge (i, j) by dw changes L by dw*u*u' with u = e_i - e_j.
+    Since u is orthogonal to the constant vector, inv(L + J/n) = PinvL + J/n gets the
+    Sherman-Morrison update PinvL -= c*v*v', v = PinvL*u, c = dw/(1 + dw*u'*v), and
+    by the matrix determinant lemma log det(L + J/n) grows by log(1 + dw*u'*v).
+    A change with 1 + dw*u'*v <= 0 disconnects the network and is refused.
+
+    Input:
+    W: the symmetric weighted adjacent matrix of a connected network
+    take_pseudoinverse: whether Sigma is built from the pseudoinverse of L
+    tol: the smallest accepted 1 + dw*u'*v, relative to 1
+
+    Attributes:
+    W, L, PinvL, sigma, inv, logdet: as in EncodedNetwork
+    """
+
+    def __init__(self, W, take_pseudoinverse=False, tol=1e-10):
+        W = np.array(W, dtype=np.float64)
+        assert W.shape[0] == W.shape[1], 'The adjacent matrix is not square'
+        assert np.allclose(W, W.T), 'Incremental updates need an undirected network'
+        self.W = W
+        self.take_pseudoinverse = take_pseudoinverse
+        self.tol = tol
+        self.refresh()
+
+    def refresh(self):
+        """
+        recompute the encoding from W, discarding the rounding errors accumulated
+        by the updates
+        """
+        self.L, self.PinvL, _ = generate_random_variable(self.W)
+        n = self.W.shape[0]
+        sign, logdet = np.linalg.slogdet(self.L + np.ones((n, n)) / n)
+        if sign <= 0:
+            raise np.linalg.LinAlgError('The network is not connected')
+        self.logdet_laplacian = logdet
+        self.update_num = 0
+
+    @property
+    def shape(self):
+        return self.W.shape
+
+    @property
+    def sigma(self):
+        n = self.W.shape[0]
+        if self.take_pseudoinverse:
+            return self.PinvL + np.ones((n, n)) / n
+        return self.L + np.ones((n, n)) / n
+
+    @property
+    def inv(self):
+        n = self.W.shape[0]
+        if self.take_pseudoinverse:
+            return self.L + np.ones((n, n)) / n
+        return self.PinvL + np.ones((n, n)) / n
+
+    @property
+    def logdet(self):
+        if self.take_pseudoinverse:
+            return -self.logdet_laplacian
+        return self.logdet_laplacian
+
+    def update_edge(self, i, j, dw):
+        """
+        Input:
+        i, j: the nodes of the edge, i != j
+        dw: the change of the weight of the edge
+
+        Output:
+        v: PinvL*u before the update, with u = e_i - e_j
+        c: the coefficient of the update PinvL -= c*v*v'
+        """
+        assert i != j, 'Self-loops do not change the graph Laplacian'
+        v = self.PinvL[:, i] - self.PinvL[:, j]
+        denominator = 1.0 + dw * (v[i] - v[j])
+        if denominator <= self.tol:
+            raise np.linalg.LinAlgError('Changing edge ({}, {}) by {} disconnects the network'.format(i, j, dw))
+        c = dw / denominator
+
+        self.W[i, j] += dw
+        self.W[j, i] += dw
+        self.L[i, i] += dw
+        self.L[j, j] += dw
+        self.L[i, j] -= dw
+        self.L[j, i] -= dw
+        self.PinvL -= c * np.outer(v, v)
+        self.logdet_laplacian += np.log(denominator)
+        self.update_num += 1
+        return v, c
+
+    def set_edge(self, i, j, w):
+        """
+        set the weight of edge (i, j) to w, 0 removes the edge
+        """
+        return self.update_edge(i, j, w - self.W[i, j])
+
+    def add_edge(self, i, j, w=1.0):
+        return self.update_edge(i, j, w)
+
+    def remove_edge(self, i, j):
+        return self.set_edge(i, j, 0.0)
+
+    def encoded_network(self):
+        """
+        Output:
+        an EncodedNetwork of the current state, sharing no arrays with self
+        """
+        network = EncodedNetwork(self.W.copy(), self.take_pseudoinverse)
+        network.__dict__['L'] = self.L.copy()
+        network.__dict__['PinvL'] = self.PinvL.copy()
+        network.__dict__['sigma'] = self.sigma
+        network.__dict__['inv'] = self.inv
+        network.__dict__['logdet'] = self.logdet
+        return network
+
+
+def _quadratic_form(M, i, j):
+    # u'*M*u with u = e_i - e_j
+    return M[i, i] + M[j, j] - M[i, j] - M[j, i]
+
+
+class DivergenceTracker(object):
+    """
+    Track the information divergences between an IncrementalNetwork A and a fixed
+    reference network B while A changes edge by edge.
+
+    With R = inv(Sigma_b) fixed, every edge change is a rank-one change of Sigma_a
+    and of inv(Sigma_a): one of them is dw*u*u', which changes a trace term by
+    dw*u'*M*u in O(1), the other is -c*v*v', which changes the other trace term by
+    -c*v'*M*v in O(n^2). The log-determinants come from the network.
+
+    Input:
+    network: an IncrementalNetwork A
+    reference: the covariance matrix Sigma of network B, or its EncodedNetwork
+    """
+
+    def __init__(self, network, reference):
+        self.network = network
+        self.reference = as_encoded_network(reference)
+        assert self.reference.shape == network.shape, 'The networks need the same size, use network_approximation first'
+        self.refresh()
+
+    def refresh(self):
+        """
+        recompute the encoding of the network and the trace terms from scratch
+        """
+        self.network.refresh()
+        # tr(inv(Sigma_b)*Sigma_a) and tr(inv(Sigma_a)*Sigma_b)
+        self.trace_ab = np.sum(self.reference.inv * self.network.sigma.T)
+        self.trace_ba = np.sum(self.network.inv * np.asarray(self.reference.sigma).T)
+
+    @property
+    def divergence(self):
+        """
+        Output:
+        d_ab: the information divergence from the network to the reference
+        d_ba: the information divergence from the reference to the network
+        """
+        n = self.network.shape[0]
+        d_ab = 0.5*(self.trace_ab - n + self.reference.logdet - self.network.logdet)
+        d_ba = 0.5*(self.trace_ba - n + self.network.logdet - self.reference.logdet)
+        return d_ab, d_ba
+
+    def update_edge(self, i, j, dw):
+        """
+        change the weight of edge (i, j) of the network by dw
+
+        Output:
+        the updated (d_ab, d_ba)
+        """
+        v, c = self.network.update_edge(i, j, dw)
+        R, sigma_b = self.reference.inv, np.asarray(self.reference.sigma)
+        if self.network.take_pseudoinverse:
+            # Sigma_a = PinvL + J/n and inv(Sigma_a) = L + J/n
+            self.trace_ab -= c * np.dot(v, np.dot(R, v))
+            self.trace_ba += dw * _quadratic_form(sigma_b, i, j)
+        else:
+            # Sigma_a = L + J/n and inv(Sigma_a) = PinvL + J/n
+            self.trace_ab += dw * _quadratic_form(R, i, j)
+            self.trace_ba -= c * np.dot(v, np.dot(sigma_b, v))
+        return self.divergence
+
+    def set_edge(self, i, j, w):
+        return self.update_edge(i, j, w - self.network.W[i, j])
+
+    def add_edge(self, i, j, w=1.0):
+        return self.update_edge(i, j, w)
+
+    def remove_edge(self, i, j):
+        return self.set_edge(i, j, 0.0)
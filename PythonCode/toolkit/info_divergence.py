@@ -1,23 +1,138 @@
+import tempfile
+import uuid
+
 import numpy as np
 
+from .encoded_network import as_encoded_network
+from .parallel import imap_unordered, resolve_n_jobs
+from .store import NetworkStore
+from .sparse_encoding import trace_of_solve
+from .profiling import span
+from .stochastic import stochastic_infomation_divergence
+
 
-def infomation_divergence(sigma_a, sigma_b):
+def infomation_divergence(sigma_a, sigma_b, method='exact', **options):
     """
     Input:
-    sigma_a: the covariance matrix Sigma of network a
-    sigma_b: the covariance matrix Sigma of network b
+    sigma_a: the covariance matrix Sigma of network a, or its EncodedNetwork
+    sigma_b: the covariance matrix Sigma of network b, or its EncodedNetwork
+    method: 'exact', or 'stochastic' for the matrix-free estimate of
+        stochastic_infomation_divergence, which also reports standard errors
+    options: keyword arguments of stochastic_infomation_divergence, e.g. probe_num,
+        tol, time_budget or seed
 
     Output:
     d_ab: the information divergence from a to b
     d_ba: the information divergence from b to a
     """
 
+    assert method in ('exact', 'stochastic'), 'Unknown divergence method: {}'.format(method)
+    if method == 'stochastic':
+        return stochastic_infomation_divergence(sigma_a, sigma_b, **options)[:2]
+
+    network_a = as_encoded_network(sigma_a)
+    network_b = as_encoded_network(sigma_b)
+
     # d_ab = 0.5*(np.trace(np.matmul(np.linalg.inv(sigma_b), sigma_a)) - sigma_a.shape[0] 
     #             + np.log(np.linalg.det(sigma_b)/np.linalg.det(sigma_a)))
-    d_ab = 0.5*(np.trace(np.matmul(np.linalg.inv(sigma_b), sigma_a)) - sigma_a.shape[0] 
-                + np.log(np.prod(np.linalg.eigvals(sigma_b)/np.linalg.eigvals(sigma_a))))
-    # d_ba = 0.5*(np.trace(np.matmul(np.linalg.inv(sigma_a), sigma_b)) - sigma_b.shape[0] 
-    #             + np.log(np.linalg.det(sigma_a)/np.linalg.det(sigma_b)))
-    d_ba = 0.5*(np.trace(np.matmul(np.linalg.inv(sigma_a), sigma_b)) - sigma_b.shape[0] 
-                + np.log(np.prod(np.linalg.eigvals(sigma_a)/np.linalg.eigvals(sigma_b))))
+    # tr(inv(sigma_b)*sigma_a) is taken elementwise and the log-determinants come
+    # from the cached factorizations, which avoids overflow of the determinants
+    if network_a.is_sparse or network_b.is_sparse:
+        with span('trace', n=network_a.shape[0], sparse=True):
+            trace_ab = trace_of_solve(network_b, network_a.sigma)
+            trace_ba = trace_of_solve(network_a, network_b.sigma)
+    else:
+        inv_a, inv_b = network_a.inv, network_b.inv
+        with span('trace', n=network_a.shape[0], sparse=False):
+            trace_ab = np.einsum('ij,ji->', inv_b, network_a.sigma)
+            trace_ba = np.einsum('ij,ji->', inv_a, network_b.sigma)
+    d_ab = 0.5*(trace_ab - network_a.shape[0] + network_b.logdet - network_a.logdet)
+    d_ba = 0.5*(trace_ba - network_b.shape[0] + network_a.logdet - network_b.logdet)
     return d_ab, d_ba
+
+
+def _state_networks(state):
+    # worker processes open the networks of the store as memory maps the first time
+    if 'networks' not in state:
+        store = NetworkStore(state['store_root'])
+        state['networks'] = [store.get(name) for name in state['names']]
+    return state['networks']
+
+
+def _trace_block(state, task):
+    start, stop = task
+    networks, block_size = _state_networks(state), state['block_size']
+    traces = np.empty((stop - start, len(networks)))
+    # only one block of rows and one block of columns are stacked at a time
+    rows = np.array([network.sigma.T.ravel() for network in networks[start:stop]])
+    for column in range(0, len(networks), block_size):
+        columns = np.array([network.inv.ravel() for network in networks[column:column+block_size]])
+        traces[:, column:column+block_size] = np.matmul(rows, columns.T)
+    return start, traces
+
+
+def pairwise_divergence(sigmas, block_size=16, n_jobs=None, store=None):
+    """
+    compute the information divergence between every pair of dense networks of the
+    same size; sparse networks have no dense inverse of Sigma, compare them pair by
+    pair with infomation_divergence
+
+    Input:
+    sigmas: a sequence of N dense covariance matrices Sigma (or EncodedNetworks), all
+        n*n, or a NetworkStore whose networks, in the order of its names, are compared
+    block_size: the number of networks handled together in one matrix product; the
+        stacked blocks take 2*block_size*n*n*8 bytes per process
+    n_jobs: the number of worker processes that share the row blocks, None for serial
+    store: with n_jobs, a NetworkStore or directory the networks of a sequence are
+        written to under unique names, removed before returning, so that workers
+        memory-map Sigma and its inverse instead of receiving pickled copies; a
+        temporary directory if None
+
+    Output:
+    d: N*N matrix, d[a, b] is the information divergence from a to b
+    """
+
+    if isinstance(sigmas, NetworkStore):
+        store, names = sigmas, sigmas.names()
+        networks = [store.get(name) for name in names]
+    else:
+        networks = [as_encoded_network(sigma) for sigma in sigmas]
+        names = None
+    n = networks[0].shape[0]
+    assert all(network.shape == (n, n) for network in networks), \
+        'All networks need the same size, use network_approximation first'
+    assert not any(network.is_sparse for network in networks), \
+        'pairwise_divergence needs dense networks, use infomation_divergence for sparse ones'
+
+    # tr(inv(sigma_b)*sigma_a) = <vec(sigma_a'), vec(inv(sigma_b))>, so with every
+    # Sigma factorized once the trace terms of all pairs are plain matrix products
+    logdets = np.array([network.logdet for network in networks])
+    tasks = [(start, min(start + block_size, len(networks))) for start in range(0, len(networks), block_size)]
+
+    written = []
+    with tempfile.TemporaryDirectory() as temporary_root:
+        try:
+            if resolve_n_jobs(n_jobs) == 1:
+                state = {'networks': networks, 'block_size': block_size}
+            else:
+                if names is None:
+                    store = NetworkStore(temporary_root) if store is None else store
+                    store = NetworkStore(store) if isinstance(store, str) else store
+                    # unique names leave the networks of the store and of concurrent calls alone
+                    prefix = 'pairwise-{}'.format(uuid.uuid4().hex)
+                    names = ['{}-{}'.format(prefix, i) for i in range(len(networks))]
+                    for name, network in zip(names, networks):
+                        store.put(name, network, arrays=('sigma', 'inv', 'logdet'))
+                        written.append(name)
+                state = {'store_root': store.root, 'names': names, 'block_size': block_size}
+
+            traces = np.empty((len(networks), len(networks)))
+            for start, block in imap_unordered(_trace_block, tasks, n_jobs, state):
+                traces[start:start+block.shape[0]] = block
+        finally:
+            for name in written:
+                store.remove(name)
+
+    d = 0.5*(traces - n + logdets.reshape(1, -1) - logdets.reshape(-1, 1))
+    np.fill_diagonal(d, 0)
+    return d
@@ -1,26 +1,37 @@
 import numpy as np
 
-from .utils import multivar_gaussian_rand_num_generator, entropy_estimation
+from .utils import entropy_estimation
+from .encoded_network import as_encoded_network
+from .sampling import default_sampler
 
 
-def mutual_infomation(sigma_a, sigma_b, sample_num, k):
+def mutual_infomation(sigma_a, sigma_b, sample_num, k, entropy_method='knn', entropy_options=None, seed=None,
+                      dtype=None, sample_bank=None):
     """
     Input:
-    sigma_a: the covariance matrix Sigma of network a
-    sigma_b: the covariance matrix Sigma of network b
+    sigma_a: the covariance matrix Sigma of network a, or its EncodedNetwork
+    sigma_b: the covariance matrix Sigma of network b, or its EncodedNetwork
     sample_num: the number of samples in random sample generation
     k: the number of nearest neighbors in KNN-based entropy estimation
+    entropy_method: the entropy estimator of the joint samples, see entropy_estimation
+    entropy_options: a dict of keyword arguments of the entropy estimator
+    seed: None, an int, a SeedSequence or a numpy.random.Generator of the samples,
+        the global numpy random state is used if None
+    dtype: the dtype of the samples, e.g. np.float32 to halve their memory, the
+        dtype of toolkit.sampling.default_sampler if None
+    sample_bank: a SampleBank of sample_num samples per network; the samples of a
+        and b and their Chebyshev distances are then taken from the bank instead of
+        being drawn, and seed and dtype are not used
 
     Output:
     mi: the mutual information between a and b
     """
 
-    sample_a = multivar_gaussian_rand_num_generator(np.zeros(sigma_a.shape[0]), sigma_a, sample_num)[0]
-    sample_b = multivar_gaussian_rand_num_generator(np.zeros(sigma_b.shape[0]), sigma_b, sample_num)[0]
-    joint_samples = np.concatenate((sample_a, sample_b), axis=0).T
+    network_a = as_encoded_network(sigma_a)
+    network_b = as_encoded_network(sigma_b)
 
-    h_a = np.real((1.0 + np.log(2 * np.pi)) * sigma_a.shape[0] / 2.0 + np.sum(np.log(np.linalg.eigvals(sigma_a))) / 2.0)
-    h_b = np.real((1.0 + np.log(2 * np.pi)) * sigma_b.shape[0] / 2.0 + np.sum(np.log(np.linalg.eigvals(sigma_b))) / 2.0)
+    h_a = (1.0 + np.log(2 * np.pi)) * network_a.shape[0] / 2.0 + network_a.logdet / 2.0
+    h_b = (1.0 + np.log(2 * np.pi)) * network_b.shape[0] / 2.0 + network_b.logdet / 2.0
 
     if h_a<0.0:
         h_a=0.0
@@ -28,7 +39,19 @@ def mutual_infomation(sigma_a, sigma_b, sample_num, k):
     if h_b<0.0:
         h_b=0.0
 
-    h_ab = entropy_estimation(joint_samples, k)
+    if sample_bank is not None:
+        assert sample_bank.sample_num == sample_num, 'The bank holds {} samples per network'.format(
+            sample_bank.sample_num)
+        h_ab = sample_bank.joint_entropy(list(sample_bank.add_pair(network_a, network_b)), k, entropy_method,
+                                         **(entropy_options or {}))
+    else:
+        rng = None if seed is None else np.random.default_rng(seed)
+        # the samples of a and b are drawn straight into the rows of one joint buffer
+        n_a = network_a.shape[0]
+        joint = np.empty((n_a + network_b.shape[0], sample_num), dtype=dtype or default_sampler.dtype)
+        default_sampler.sample(network_a, sample_num, rng, out=joint[:n_a])
+        default_sampler.sample(network_b, sample_num, rng, out=joint[n_a:])
+        h_ab = entropy_estimation(joint.T, k, entropy_method, **(entropy_options or {}))
 
     mi = np.min([np.max([h_a + h_b - h_ab, 0]),h_a,h_b])
 
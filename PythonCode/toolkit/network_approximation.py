@@ -1,23 +1,31 @@
 import numpy as np
+import scipy.sparse as sp
 
-from .utils import pseudoinverse
+from .utils import pseudoinverse, generate_random_variable
+from .encoded_network import EncodedNetwork
 
 
-def network_approximation(W_a, W_b, L_a, L_b, PinvL_a, PinvL_b, sigma_a, sigma_b):
+def network_approximation(W_a, W_b, L_a=None, L_b=None, PinvL_a=None, PinvL_b=None, sigma_a=None, sigma_b=None,
+                          greedy=False):
     """
     This function implements network approximation if the two networks have
     different sizes (contain different numbers of nodes). 
     The approximation is defined based on Laplacian energy. 
 
     Input: 
-    WA: the weighted adjacent matrix of network A
-    WB: the weighted adjacent matrix of network B
+    WA: the weighted adjacent matrix of network A, dense or scipy.sparse
+    WB: the weighted adjacent matrix of network B, dense or scipy.sparse
     LA: the Laplacian of network A
     LB: the Laplacian of network B
     PinvLA: the Moore–Penrose pseudoinverse of LA
     PinvLB: the Moore–Penrose pseudoinverse of LB
     SigmaA: the covariance matrix Sigma of network A
     SigmaB: the covariance matrix Sigma of network B
+    If WA (WB) is an EncodedNetwork, LA, PinvLA and SigmaA (LB, PinvLB and SigmaB)
+    are taken from it and can be omitted.
+    greedy: if True, the nodes of the larger network are removed one at a time,
+    each time the least important node of the current network, instead of
+    keeping the most important nodes of the original network at once.
 
     Output:
     NLA: new Laplacian matrix of network A. If network A has a larger size,
@@ -35,6 +43,11 @@ def network_approximation(W_a, W_b, L_a, L_b, PinvL_a, PinvL_b, sigma_a, sigma_b
     Gamma: the rationality of approximation
     """
 
+    if isinstance(W_a, EncodedNetwork):
+        W_a, L_a, PinvL_a, sigma_a = W_a.W, W_a.L, W_a.PinvL, W_a.sigma
+    if isinstance(W_b, EncodedNetwork):
+        W_b, L_b, PinvL_b, sigma_b = W_b.W, W_b.L, W_b.PinvL, W_b.sigma
+
     if W_a.shape[0] == W_b.shape[0]:
         new_L_a = L_a
         new_L_b = L_b
@@ -49,13 +62,13 @@ def network_approximation(W_a, W_b, L_a, L_b, PinvL_a, PinvL_b, sigma_a, sigma_b
         gamma = 1
     elif W_a.shape[0] > W_b.shape[0]:
         new_L_a, new_PinvL_a, new_sigma_a, sort_LE_based_c, index, LE, new_LE, gamma \
-            = approximate(W_a, W_b.shape[0])
+            = approximate(W_a, W_b.shape[0], greedy)
         new_L_b = L_b
         new_PinvL_b = PinvL_b
         new_sigma_b = sigma_b
     else:
         new_L_b, new_PinvL_b, new_sigma_b, sort_LE_based_c, index, LE, new_LE, gamma \
-            = approximate(W_b, W_a.shape[0])
+            = approximate(W_b, W_a.shape[0], greedy)
         new_L_a = L_a
         new_PinvL_a = PinvL_a
         new_sigma_a = sigma_a
@@ -76,30 +89,140 @@ def network_approximation(W_a, W_b, L_a, L_b, PinvL_a, PinvL_b, sigma_a, sigma_b
     return results
         
 
-def approximate(W_a, W_b_shape):
-    deg_a = np.sum(W_a, axis=0) ** 2
-    W_a_with_zero_diag = W_a - np.diag(np.diag(W_a))
-    LE = np.sum(deg_a, axis=0) + np.sum(W_a_with_zero_diag ** 2)
-    delta_LE = np.zeros(W_a.shape[0])
-    W_a_square = np.matmul(W_a, W_a)
-    W_a_square_with_zero_diag = W_a_square - np.diag(np.diag(W_a_square))
-    for i in range(W_a.shape[0]):
-        M_a = np.delete(np.delete(W_a, i, 0), i, 1)
-        M_a_square = np.matmul(M_a, M_a)
-        M_a_square_with_zero_diag = M_a_square - np.diag(np.diag(M_a_square))
-        delta_LE[i] = 4 * W_a_square[i, i] + 2 * np.sum(W_a_square_with_zero_diag) \
-                        - np.sum(M_a_square_with_zero_diag)
-    LE_based_c = delta_LE / LE
-    sort_LE_based_c = np.sort(LE_based_c)
-    index = np.argsort(LE_based_c)
+def laplacian_energy(W):
+    """
+    Input:
+    W: the weighted adjacent matrix, dense or scipy.sparse
+
+    Output:
+    LE: the Laplacian energy of the network
+    """
+    if sp.issparse(W):
+        deg = np.asarray(W.sum(axis=0)).ravel()
+        W_with_zero_diag = W - sp.diags(W.diagonal())
+        return np.sum(deg ** 2) + W_with_zero_diag.multiply(W_with_zero_diag).sum()
+    deg = np.sum(W, axis=0)
+    # the squared off-diagonal weights, without an n*n temporary
+    return np.sum(deg ** 2, axis=0) + np.einsum('ij,ij->', W, W) - np.sum(np.diag(W) ** 2)
+
+
+def delta_laplacian_energy(W):
+    """
+    compute, for every node i, the Laplacian energy term
+    4*(W^2)_ii + 2*sum(offdiag(W^2)) - sum(offdiag(M_i^2)), where M_i is W without
+    node i, in closed form from W, the diagonal of W^2 and the row and column sums,
+    in O(n^2) time for a dense W and O(m) for a scipy.sparse W
+
+    Input:
+    W: the weighted adjacent matrix, dense or scipy.sparse
+
+    Output:
+    delta_LE: the vector of the Laplacian energy terms of all nodes
+    """
+    if sp.issparse(W):
+        W = sp.csr_matrix(W)
+        col_sum = np.asarray(W.sum(axis=0)).ravel()
+        row_sum = np.asarray(W.sum(axis=1)).ravel()
+        square_diag = np.asarray(W.multiply(W.T).sum(axis=1)).ravel()
+    else:
+        col_sum = np.sum(W, axis=0)
+        row_sum = np.sum(W, axis=1)
+        square_diag = np.einsum('ij,ji->i', W, W)
+    return _delta_laplacian_energy(W.diagonal(), col_sum, row_sum, square_diag,
+                                   W.T @ col_sum, W @ row_sum)
+
+
+def _delta_laplacian_energy(diag, col_sum, row_sum, square_diag, weighted_col_sum, weighted_row_sum):
+    # sum(W^2) = col_sum * row_sum and tr(W^2) = sum(square_diag); removing node i
+    # takes its row and column out of every partial sum
+    square_sum = np.dot(col_sum, row_sum)
+    square_trace = np.sum(square_diag)
+    M_square_sum = square_sum - weighted_col_sum - weighted_row_sum + square_diag \
+                    - (col_sum - diag) * (row_sum - diag)
+    M_square_trace = square_trace - 2 * square_diag + diag ** 2
+    return 4 * square_diag + 2 * (square_sum - square_trace) - (M_square_sum - M_square_trace)
+
+
+def _greedy_removal(W, remove_num):
+    """
+    remove remove_num nodes one at a time, always the node with the smallest
+    Laplacian energy term in the current network, updating the partial sums of
+    delta_laplacian_energy after every removal in O(n^2) time for a dense W and
+    O(m) for a scipy.sparse W
+
+    Output:
+    order: the removed nodes followed by the kept nodes sorted by their final term
+    delta_LE: the term of every node when it was removed, or its final term if kept
+    """
+    n = W.shape[0]
+    if sp.issparse(W):
+        W = sp.csr_matrix(W)
+        W_T = W.T.tocsr()
+        row = lambda i: W.getrow(i).toarray().ravel()
+        column = lambda i: W_T.getrow(i).toarray().ravel()
+        col_sum = np.asarray(W.sum(axis=0)).ravel()
+        row_sum = np.asarray(W.sum(axis=1)).ravel()
+        square_diag = np.asarray(W.multiply(W_T).sum(axis=1)).ravel()
+    else:
+        W_T = W.T
+        row = lambda i: W[i]
+        column = lambda i: W[:, i]
+        col_sum = np.sum(W, axis=0).astype(float)
+        row_sum = np.sum(W, axis=1).astype(float)
+        square_diag = np.einsum('ij,ji->i', W, W).astype(float)
+    diag = W.diagonal().astype(float)
+    weighted_col_sum = W_T @ col_sum
+    weighted_row_sum = W @ row_sum
+
+    active = np.ones(n, dtype=bool)
+    removed = []
+    delta_LE = np.zeros(n)
+    for _ in range(remove_num):
+        current = _delta_laplacian_energy(diag[active], col_sum[active], row_sum[active], square_diag[active],
+                                          weighted_col_sum[active], weighted_row_sum[active])
+        i = np.flatnonzero(active)[np.argmin(current)]
+        delta_LE[i] = np.min(current)
+        active[i] = False
+        removed.append(i)
+
+        row_i = row(i) * active
+        column_i = column(i) * active
+        weighted_col_sum -= row(i) * col_sum[i] + W_T @ row_i
+        weighted_row_sum -= column(i) * row_sum[i] + W @ column_i
+        col_sum -= row_i
+        row_sum -= column_i
+        square_diag -= row_i * column_i
+
+    kept = np.flatnonzero(active)
+    delta_LE[kept] = _delta_laplacian_energy(diag[kept], col_sum[kept], row_sum[kept], square_diag[kept],
+                                             weighted_col_sum[kept], weighted_row_sum[kept])
+    kept = kept[np.argsort(delta_LE[kept])]
+    return np.concatenate((np.array(removed, dtype=int), kept)), delta_LE
+
+
+def approximate(W_a, W_b_shape, greedy=False):
+    if sp.issparse(W_a):
+        W_a = sp.csr_matrix(W_a, dtype=np.float64)
+    LE = laplacian_energy(W_a)
+    if greedy:
+        index, delta_LE = _greedy_removal(W_a, W_a.shape[0] - W_b_shape)
+        sort_LE_based_c = delta_LE[index] / LE
+    else:
+        LE_based_c = delta_laplacian_energy(W_a) / LE
+        sort_LE_based_c = np.sort(LE_based_c)
+        index = np.argsort(LE_based_c)
     needed_nodes = index[-W_b_shape:]
-    W_a = W_a[needed_nodes][:, needed_nodes]
-    deg_a = np.sum(W_a, axis=0)
-    new_L_a = np.diag(deg_a) - W_a
-    new_PinvL_a = pseudoinverse(new_L_a)
-    new_sigma_a = new_L_a + np.ones(new_PinvL_a.shape) / new_PinvL_a.shape[0]
-    deg_a_sum_square = np.sum(W_a, axis=0) ** 2
-    W_a_with_zero_diag = W_a - np.diag(np.diag(W_a))
-    new_LE = np.sum(deg_a_sum_square, axis=0) + np.sum(W_a_with_zero_diag ** 2)
+    if sp.issparse(W_a):
+        W_a = W_a[needed_nodes][:, needed_nodes]
+        new_L_a, new_PinvL_a, new_sigma_a = generate_random_variable(W_a)
+    else:
+        # one copy of the kept block, then D - W in a new buffer without materializing D
+        W_a = W_a[np.ix_(needed_nodes, needed_nodes)]
+        new_L_a = np.negative(W_a, dtype=np.float64)
+        diagonal = np.einsum('ii->i', new_L_a)
+        diagonal += np.sum(W_a, axis=0)
+        new_PinvL_a = pseudoinverse(new_L_a)
+        new_sigma_a = new_L_a + 1.0 / new_L_a.shape[0]
+    new_LE = laplacian_energy(W_a)
     gamma = new_LE / LE
     return new_L_a, new_PinvL_a, new_sigma_a, sort_LE_based_c, index, LE, new_LE, gamma
@@ -0,0 +1,192 @@
+import heapq
+
+import numpy as np
+
+from .encoded_network import as_encoded_network
+from .info_divergence import infomation_divergence
+
+
+DIRECTIONS = ('ab', 'ba', 'symmetric')
+
+
+def signature_positions(n, signature_size):
+    """
+    Input:
+    n: the number of nodes
+    signature_size: the number of eigenvalues kept, half from each end of the spectrum
+
+    Output:
+    the positions in the ascending spectrum kept in the signatures of n-node networks
+    """
+    if n <= signature_size:
+        return np.arange(n)
+    half = signature_size // 2
+    return np.concatenate((np.arange(half), np.arange(n - (signature_size - half), n)))
+
+
+def _one_sided_bound(log_r, rest_log_r, rest_num):
+    # 0.5*sum(r - 1 - log r) over the known ratios, plus the AM-GM bound of the
+    # rest_num unknown ratios whose log-sum rest_log_r is known from the logdets
+    bound = np.sum(np.exp(log_r) - 1 - log_r, axis=-1)
+    if rest_num:
+        mu = rest_log_r / rest_num
+        bound = bound + rest_num * (np.exp(mu) - 1 - mu)
+    return 0.5 * bound
+
+
+def divergence_lower_bound(eigvals_a, logdet_a, eigvals_b, logdet_b, n, direction='ab'):
+    """
+    Lower bound of the information divergence from the spectral signatures.
+
+    With the eigenvalues of both Sigma sorted the same way, r_i = alpha_i / beta_i,
+    the trace inequality of von Neumann gives tr(inv(Sigma_b)*Sigma_a) >= sum r_i,
+    so d_ab >= 0.5*sum(r_i - 1 - log r_i), a sum of nonnegative terms. Terms of the
+    eigenvalues missing from the signatures are bounded together by AM-GM, since
+    the sum of their log r_i follows from the log-determinants.
+
+    Input:
+    eigvals_a: the signature eigenvalues of Sigma_a
+    logdet_a: the log-determinant of Sigma_a
+    eigvals_b: the signature eigenvalues of Sigma_b at the same positions, or a
+        matrix with one signature per row
+    logdet_b: the log-determinant of Sigma_b, or a vector of them
+    n: the number of nodes
+    direction: 'ab' for d_ab, 'ba' for d_ba, 'symmetric' for d_ab + d_ba
+
+    Output:
+    the lower bound, or a vector of lower bounds
+    """
+    assert direction in DIRECTIONS, 'Unknown direction: {}'.format(direction)
+    log_r = np.log(eigvals_a) - np.log(eigvals_b)
+    rest_num = n - log_r.shape[-1]
+    rest_log_r = logdet_a - np.asarray(logdet_b) - np.sum(log_r, axis=-1)
+    bound = 0.0
+    if direction in ('ab', 'symmetric'):
+        bound = bound + _one_sided_bound(log_r, rest_log_r, rest_num)
+    if direction in ('ba', 'symmetric'):
+        bound = bound + _one_sided_bound(-log_r, -rest_log_r, rest_num)
+    return bound
+
+
+class SpectralIndex(object):
+    """
+    Index of encoded networks for top-k queries by information divergence. Every
+    network is summarized by a spectral signature, the smallest and largest
+    eigenvalues of its Sigma plus its log-determinant. A query computes the lower
+    bounds of the divergence to all indexed networks of its size from the
+    signatures, which costs O(signature_size) per network, and evaluates the exact
+    divergence in increasing order of the bounds until the next bound exceeds the
+    k-th best divergence, so the result is the exact top k.
+
+    Input:
+    signature_size: the number of eigenvalues kept per network
+    store: a NetworkStore holding the indexed networks, which are then loaded
+        from it for the exact divergences instead of being kept in memory
+    """
+
+    def __init__(self, signature_size=32, store=None):
+        self.signature_size = signature_size
+        self.store = store
+        self._groups = {}
+        self._networks = {}
+        self.last_exact_num = 0
+
+    @classmethod
+    def from_store(cls, store, signature_size=32):
+        """
+        Index every network of a NetworkStore
+        """
+        index = cls(signature_size, store)
+        for name in store.names():
+            index.add(name, store.get(name))
+        return index
+
+    def __len__(self):
+        return sum(len(group['names']) for group in self._groups.values())
+
+    def __contains__(self, name):
+        return any(name in group['names'] for group in self._groups.values())
+
+    def _signature(self, network):
+        assert not network.is_sparse, 'The spectral signature needs a dense Sigma'
+        assert network.is_symmetric, 'The spectral signature needs a symmetric Sigma'
+        eigvals = np.asarray(network.eigvals)
+        assert eigvals[0] > 0, 'The spectral signature needs a positive definite Sigma, is the network connected?'
+        positions = signature_positions(network.shape[0], self.signature_size)
+        return eigvals[positions], float(network.logdet)
+
+    def add(self, name, sigma):
+        """
+        Input:
+        name: the name of the network
+        sigma: the covariance matrix Sigma of the network, or its EncodedNetwork
+        """
+        assert name not in self, 'Network {} is already indexed'.format(name)
+        network = as_encoded_network(sigma)
+        eigvals, logdet = self._signature(network)
+        group = self._groups.setdefault(network.shape[0], {'names': [], 'eigvals': [], 'logdets': []})
+        group['names'].append(name)
+        group['eigvals'].append(eigvals)
+        group['logdets'].append(logdet)
+        if self.store is None:
+            self._networks[name] = network
+
+    def network(self, name):
+        if self.store is None:
+            return self._networks[name]
+        return self.store.get(name)
+
+    def lower_bounds(self, sigma, direction='ab'):
+        """
+        Input:
+        sigma: the covariance matrix Sigma of the query network, or its EncodedNetwork
+        direction: 'ab' for the divergence from the query to the indexed networks,
+            'ba' for the opposite one, 'symmetric' for their sum
+
+        Output:
+        names: the indexed networks of the same size as the query
+        bounds: the lower bounds of their divergences
+        """
+        network = as_encoded_network(sigma)
+        n = network.shape[0]
+        if n not in self._groups:
+            return [], np.zeros(0)
+        group = self._groups[n]
+        eigvals, logdet = self._signature(network)
+        bounds = divergence_lower_bound(eigvals, logdet, np.array(group['eigvals']), np.array(group['logdets']),
+                                        n, direction)
+        return list(group['names']), np.maximum(bounds, 0)
+
+    def query(self, sigma, k=1, direction='ab', max_exact=None):
+        """
+        Input:
+        sigma: the covariance matrix Sigma of the query network, or its EncodedNetwork;
+            only indexed networks of the same size are compared, use
+            network_approximation first to compare networks of different sizes
+        k: the number of nearest networks
+        direction: 'ab' for the divergence from the query to the indexed networks,
+            'ba' for the opposite one, 'symmetric' for their sum
+        max_exact: the maximal number of exact divergences, None for an exact top k;
+            with a budget the result is the best among the most promising candidates
+
+        Output:
+        a list of at most k (name, divergence) pairs, nearest first
+        """
+        network = as_encoded_network(sigma)
+        names, bounds = self.lower_bounds(network, direction)
+
+        best = []
+        self.last_exact_num = 0
+        for i in np.argsort(bounds, kind='stable'):
+            if len(best) == k and bounds[i] >= -best[0][0]:
+                break
+            if max_exact is not None and self.last_exact_num >= max_exact:
+                break
+            d_ab, d_ba = infomation_divergence(network, self.network(names[i]))
+            divergence = {'ab': d_ab, 'ba': d_ba, 'symmetric': d_ab + d_ba}[direction]
+            self.last_exact_num += 1
+            # max-heap of the k best divergences
+            heapq.heappush(best, (-divergence, i))
+            if len(best) > k:
+                heapq.heappop(best)
+        return [(names[i], -negative) for negative, i in sorted(best, reverse=True)]
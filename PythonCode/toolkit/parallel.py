@@ -0,0 +1,90 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+
+_worker_state = {}
+_exhausted = object()
+
+
+def _init_worker(state):
+    _worker_state.clear()
+    _worker_state.update(state)
+
+
+def _run_task(func, task):
+    return func(_worker_state, task)
+
+
+def resolve_n_jobs(n_jobs):
+    """
+    Input:
+    n_jobs: the number of worker processes, None or 1 for serial execution, -1 for all cpus
+
+    Output:
+    the number of worker processes to use
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    return max(1, n_jobs)
+
+
+def resolve_seed_sequence(seed):
+    """
+    Input:
+    seed: None, an int or a SeedSequence
+
+    Output:
+    a SeedSequence; for None it is seeded from the global numpy random state, so
+    results computed after np.random.seed(...) are reproducible
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if seed is None:
+        return np.random.SeedSequence(int(np.random.randint(0, 2**63 - 1, dtype=np.int64)))
+    return np.random.SeedSequence(seed)
+
+
+def imap_unordered(func, tasks, n_jobs=None, state=None, max_pending=None):
+    """
+    Apply func(state, task) to every task and yield the results as they finish.
+    The shared state is sent once to every worker process instead of once per task.
+    Tasks are drawn lazily from the iterable, so at most max_pending of them are
+    held in memory at a time.
+
+    Input:
+    func: a module-level function taking (state, task)
+    tasks: an iterable of picklable tasks
+    n_jobs: the number of worker processes, None or 1 runs in the calling process
+    state: a dict of data shared by all tasks
+    max_pending: the maximal number of submitted but unfinished tasks, 2*n_jobs by default
+
+    Output:
+    an iterator over the results, in completion order
+    """
+    state = {} if state is None else state
+    n_jobs = resolve_n_jobs(n_jobs)
+    if n_jobs == 1:
+        for task in tasks:
+            yield func(state, task)
+        return
+
+    max_pending = 2 * n_jobs if max_pending is None else max_pending
+    tasks = iter(tasks)
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(state,)) as executor:
+        pending = set()
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_pending:
+                task = next(tasks, _exhausted)
+                if task is _exhausted:
+                    exhausted = True
+                else:
+                    pending.add(executor.submit(_run_task, func, task))
+            if pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
@@ -0,0 +1,220 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+
+_profilers = []
+_callbacks = []
+_local = threading.local()
+
+
+class _NullSpan(object):
+    """
+    the span returned while nothing listens, entering it does nothing
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_null_span = _NullSpan()
+
+
+class _Span(object):
+    __slots__ = ('name', 'meta', 'start', 'depth', 'memory_start', 'memory_peak')
+
+    def __init__(self, name, meta):
+        self.name = name
+        self.meta = meta
+
+    def __enter__(self):
+        stack = _stack()
+        self.depth = len(stack)
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1].memory_peak = max(stack[-1].memory_peak, peak)
+            tracemalloc.reset_peak()
+            self.memory_start = self.memory_peak = current
+        else:
+            self.memory_start = None
+        stack.append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter_ns()
+        stack = _stack()
+        stack.pop()
+        record = {
+            'name': self.name,
+            'start_ns': self.start,
+            'duration_ns': end - self.start,
+            'depth': self.depth,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'meta': self.meta,
+        }
+        if self.memory_start is not None and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            self.memory_peak = max(self.memory_peak, peak)
+            record['allocated_bytes'] = current - self.memory_start
+            record['peak_bytes'] = self.memory_peak - self.memory_start
+            if stack and stack[-1].memory_start is not None:
+                stack[-1].memory_peak = max(stack[-1].memory_peak, self.memory_peak)
+            tracemalloc.reset_peak()
+        for profiler in list(_profilers):
+            profiler.records.append(record)
+        for callback in list(_callbacks):
+            callback(record)
+        return False
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def span(name, **meta):
+    """
+    Time the enclosed block as a named span, e.g.
+
+        with span('cholesky', n=sigma.shape[0]):
+            ...
+
+    When no profiler is active and no callback is registered, a shared no-op
+    context is returned, so instrumented code pays a single list check.
+
+    Input:
+    name: the name of the span
+    meta: JSON-serializable details of the span, e.g. matrix sizes
+    """
+    if not _profilers and not _callbacks:
+        return _null_span
+    return _Span(name, meta)
+
+
+def register_span_callback(callback):
+    """
+    Call callback(record) with the record dict of every finished span, until
+    unregister_span_callback(callback) is called. A record holds the name,
+    start_ns, duration_ns, depth, pid, tid and meta of the span, plus
+    allocated_bytes and peak_bytes while tracemalloc is tracing.
+    """
+    _callbacks.append(callback)
+    return callback
+
+
+def unregister_span_callback(callback):
+    _callbacks.remove(callback)
+
+
+class Profiler(object):
+    """
+    Collects the spans finished in this process while it is active. Spans of
+    worker processes (n_jobs > 1) are not collected, profile with n_jobs=None to
+    see the per-partition spans.
+
+    Input:
+    trace_memory: whether to run tracemalloc, adding the allocated and peak
+        bytes of every span (numpy buffers included) at the price of slower
+        allocations
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.records = []
+        self._started_tracemalloc = False
+
+    def __enter__(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        _profilers.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _profilers.remove(self)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        return False
+
+    def summary(self):
+        """
+        Output:
+        a dict from span name to its count, total, mean and max duration in seconds
+        """
+        summary = {}
+        for record in self.records:
+            entry = summary.setdefault(record['name'], {'count': 0, 'total': 0.0, 'max': 0.0})
+            duration = record['duration_ns'] * 1e-9
+            entry['count'] += 1
+            entry['total'] += duration
+            entry['max'] = max(entry['max'], duration)
+        for entry in summary.values():
+            entry['mean'] = entry['total'] / entry['count']
+        return summary
+
+    def to_json(self, path=None):
+        """
+        Output:
+        the records and their summary as a JSON string, also written to path if given
+        """
+        text = json.dumps({'records': self.records, 'summary': self.summary()}, indent=1, default=str)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def to_chrome_trace(self, path=None):
+        """
+        Output:
+        the records in the Chrome trace event format, viewable in chrome://tracing
+        or Perfetto, as a JSON string, also written to path if given
+        """
+        origin = min((record['start_ns'] for record in self.records), default=0)
+        events = []
+        for record in self.records:
+            args = dict(record['meta'])
+            for key in ('allocated_bytes', 'peak_bytes'):
+                if key in record:
+                    args[key] = record[key]
+            events.append({
+                'name': record['name'],
+                'ph': 'X',
+                'ts': (record['start_ns'] - origin) / 1000.0,
+                'dur': record['duration_ns'] / 1000.0,
+                'pid': record['pid'],
+                'tid': record['tid'],
+                'args': args,
+            })
+        text = json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'}, default=str)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+
+def profile(trace_memory=False):
+    """
+    Collect the spans of the toolkit functions called inside the block, e.g.
+
+        with profile() as profiler:
+            granger_causality_and_transfer_entropy(sigma_a, sigma_b, 1000, 10, 2)
+        profiler.to_chrome_trace('causality.json')
+
+    Input:
+    trace_memory: whether to record the allocated and peak bytes of every span
+
+    Output:
+    a Profiler
+    """
+    return Profiler(trace_memory)
@@ -0,0 +1,262 @@
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import sqlite3
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from .encoded_network import EncodedNetwork
+from .sample_bank import SampleBank
+from .sampling import content_hash
+
+
+_missing = object()
+
+
+class UncacheableArgument(TypeError):
+    pass
+
+
+def argument_hash(value):
+    """
+    Input:
+    value: an argument of a toolkit function: a number, string, None, dtype,
+        numpy array, scipy.sparse matrix, EncodedNetwork, SeedSequence, SampleBank,
+        or a list, tuple or dict of those
+
+    Output:
+    a string identifying the content of value; raises UncacheableArgument for
+    values whose content cannot be hashed without changing them, such as
+    numpy.random.Generators and iterators
+    """
+    if value is None or isinstance(value, (bool, int, float, str, np.generic)):
+        return repr(value.item() if isinstance(value, np.generic) else value)
+    if isinstance(value, np.dtype) or (isinstance(value, type) and issubclass(value, np.generic)):
+        return 'dtype:' + np.dtype(value).str
+    if isinstance(value, np.ndarray):
+        return 'array:' + content_hash(value)
+    if sp.issparse(value):
+        value = sp.csr_matrix(value)
+        return 'csr:{}:{}:{}:{}'.format(value.shape, content_hash(value.data), content_hash(value.indices),
+                                       content_hash(value.indptr))
+    if isinstance(value, EncodedNetwork):
+        # a network is defined by W and the encoding options, or by Sigma alone
+        if value.W is not None:
+            return 'network:{}:{}:{}:{}:{}'.format(argument_hash(value.W), value.take_pseudoinverse, value.graph_type,
+                                                   value.normalize, value.sparse_solver)
+        if isinstance(value.sigma, np.ndarray):
+            return 'network:' + argument_hash(value.sigma)
+    if isinstance(value, np.random.SeedSequence):
+        return 'seed:{}:{}:{}:{}'.format(value.entropy, tuple(value.spawn_key), value.pool_size, value.n_children_spawned)
+    if isinstance(value, SampleBank):
+        return 'bank:{}:{}:{}:{}'.format(value.entropy, value.spawn_key, value.sample_num, value.dtype.str)
+    if isinstance(value, (list, tuple)):
+        return '[' + ','.join(argument_hash(item) for item in value) + ']'
+    if isinstance(value, dict):
+        return '{' + ','.join('{}:{}'.format(key, argument_hash(value[key])) for key in sorted(value)) + '}'
+    raise UncacheableArgument('Cannot hash an argument of type {}'.format(type(value).__name__))
+
+
+def _seed_sequences(value, found=None):
+    # the SeedSequences among the arguments, in the order argument_hash visits them
+    found = [] if found is None else found
+    if isinstance(value, np.random.SeedSequence):
+        if all(seed_sequence is not value for seed_sequence in found):
+            found.append(value)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _seed_sequences(item, found)
+    elif isinstance(value, dict):
+        for key in sorted(value):
+            _seed_sequences(value[key], found)
+    return found
+
+
+def seeded(arguments):
+    """
+    default rule of memoize: calls without a seed draw from the global random state,
+    and so does the stochastic divergence without a seed in its options; their
+    results are random and are not cached
+    """
+    if arguments.get('method') == 'stochastic':
+        return (arguments.get('options') or {}).get('seed') is not None
+    return arguments.get('seed', 0) is not None
+
+
+class ResultCache(object):
+    """
+    Persistent cache of toolkit results in an sqlite database, keyed by the content
+    hash of the inputs, see memoize. Every operation opens its own connection and
+    writes run in immediate transactions of a database in WAL mode, so threads and
+    worker processes can share one file. The least recently read results are
+    evicted once the pickled results exceed max_bytes.
+
+    The results are pickles: only open caches that you wrote.
+
+    Input:
+    path: the sqlite database file, created if needed
+    max_bytes: the budget of the pickled results, in bytes
+    timeout: the seconds to wait for a lock held by another process
+    """
+
+    def __init__(self, path, max_bytes=2**30, timeout=60.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+                               'nbytes INTEGER NOT NULL, accessed REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+
+    def _connect(self):
+        return _Connection(sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None))
+
+    def get(self, key, default=None):
+        with self._connect() as connection:
+            row = connection.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return default
+            connection.execute('UPDATE results SET accessed = ? WHERE key = ?', (time.time(), key))
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def put(self, key, value):
+        """
+        Store a result, evicting the least recently read ones if needed. A result
+        larger than max_bytes on its own is not stored.
+        """
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return
+        with self._connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                                   (key, blob, len(blob), time.time()))
+                excess = connection.execute('SELECT SUM(nbytes) FROM results').fetchone()[0] - self.max_bytes
+                if excess > 0:
+                    evicted = []
+                    for old_key, nbytes in connection.execute(
+                            'SELECT key, nbytes FROM results WHERE key != ? ORDER BY accessed', (key,)):
+                        if excess <= 0:
+                            break
+                        evicted.append((old_key,))
+                        excess -= nbytes
+                    connection.executemany('DELETE FROM results WHERE key = ?', evicted)
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    def __contains__(self, key):
+        with self._connect() as connection:
+            return connection.execute('SELECT 1 FROM results WHERE key = ?', (key,)).fetchone() is not None
+
+    def __len__(self):
+        with self._connect() as connection:
+            return connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def clear(self):
+        with self._connect() as connection:
+            connection.execute('DELETE FROM results')
+
+    def stats(self):
+        with self._connect() as connection:
+            results, nbytes = connection.execute('SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM results').fetchone()
+        return {'results': results, 'nbytes': nbytes, 'max_bytes': self.max_bytes, 'hits': self.hits,
+                'misses': self.misses}
+
+
+class _Connection(object):
+    # sqlite3.Connection as a context manager commits but does not close
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self.connection
+
+    def __exit__(self, *exc_info):
+        self.connection.close()
+
+
+def result_key(func_name, arguments, ignore=()):
+    """
+    Output:
+    the cache key of a call: a hash of the function, the toolkit version and the
+    content of every argument but those in ignore
+    """
+    from . import __version__
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update('{}:{}'.format(func_name, __version__).encode())
+    for name in sorted(arguments):
+        if name not in ignore:
+            digest.update('|{}={}'.format(name, argument_hash(arguments[name])).encode())
+    return digest.hexdigest()
+
+
+def memoize(cache, ignore=('n_jobs',), cacheable=seeded):
+    """
+    Decorator caching the results of a toolkit function in a ResultCache, keyed by
+    the function, toolkit.__version__ and the content of its arguments, so that an
+    identical call in a later run, or in another process, is a lookup. The wrapped
+    function keeps the signature of the original, e.g.
+
+        cache = ResultCache('results.sqlite')
+        mutual_infomation = memoize(cache)(toolkit.mutual_infomation)
+
+    Calls with an argument that argument_hash cannot identify (a Generator seed,
+    an iterator of matrices) and calls rejected by cacheable run uncached. The
+    number of children a call spawns from its SeedSequence arguments is stored
+    with the result, and a cache hit spawns as many, so that later calls with the
+    same SeedSequences see the same state as without the cache.
+
+    Input:
+    cache: a ResultCache
+    ignore: the arguments that do not change the result, left out of the key
+    cacheable: a function of the dict of bound arguments telling whether the call
+        is deterministic, see seeded
+
+    Output:
+    the decorator
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        func_name = '{}.{}'.format(func.__module__, func.__qualname__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            if cacheable is not None and not cacheable(bound.arguments):
+                return func(*args, **kwargs)
+            try:
+                key = result_key(func_name, bound.arguments, ignore)
+            except UncacheableArgument:
+                return func(*args, **kwargs)
+            seed_sequences = _seed_sequences(
+                [bound.arguments[name] for name in sorted(bound.arguments) if name not in ignore])
+            cached = cache.get(key, _missing)
+            if cached is _missing:
+                spawned = [seed_sequence.n_children_spawned for seed_sequence in seed_sequences]
+                result = func(*args, **kwargs)
+                spawned = [seed_sequence.n_children_spawned - before
+                           for seed_sequence, before in zip(seed_sequences, spawned)]
+                cache.put(key, (result, spawned))
+                return result
+            result, spawned = cached
+            for seed_sequence, children in zip(seed_sequences, spawned):
+                seed_sequence.spawn(children)
+            return result
+
+        return wrapper
+    return decorator
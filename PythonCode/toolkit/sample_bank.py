@@ -0,0 +1,288 @@
+import copy
+import json
+import os
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+from scipy.spatial.distance import cdist
+
+from .utils import entropy_estimation
+from .encoded_network import as_encoded_network
+from .entropy_estimators import knn_entropy_from_radius
+from .sampling import default_sampler, content_hash
+from .profiling import span
+
+
+class SampleBank(object):
+    """
+    Samples of the networks of a corpus, drawn once per network and reused by every
+    pair the network is part of, so that the cost of a pair is the joint entropy
+    estimation only. The samples of a network are drawn from a generator seeded by
+    SeedSequence(seed) and the content hash of its Sigma, so they do not depend on
+    the order in which networks are added, and the seed is recorded in seeds.
+
+    The Chebyshev distance matrices of the samples of every network are kept in an
+    LRU cache bounded by max_distance_bytes (sample_num**2 * 8 bytes per network).
+    The Chebyshev distance between joint samples of several networks is the
+    maximum of their distances, so a joint KNN entropy costs an elementwise maximum
+    of cached matrices instead of a neighbor search in the joint space. When the
+    pairs are visited grouped by one network, its distances stay in the cache.
+    The KNN entropies of whole networks and of their joints are cached as well.
+
+    Input:
+    sample_num: the number of samples per network
+    seed: None, an int or a SeedSequence
+    root: a directory where the samples are written as .npy files and read back as
+        read-only memory maps, with a .json entry per network recording their seed
+        and a bank.json recording the seed of the bank; opening an existing root
+        reuses its samples and its seed, and processes can add networks to the same
+        root concurrently. None keeps them in memory.
+    dtype: the dtype of the samples, the dtype of toolkit.sampling.default_sampler if None
+    max_distance_bytes: the memory budget of the cached distance matrices, 0 to
+        compute the distances by blocks for every estimate
+    """
+
+    def __init__(self, sample_num, seed=None, root=None, dtype=None, max_distance_bytes=2**30):
+        self.sample_num = sample_num
+        self.root = root
+        self.dtype = np.dtype(dtype or default_sampler.dtype)
+        self.max_distance_bytes = max_distance_bytes
+        self.seeds = {}
+        self._samples = {}
+        self._distances = OrderedDict()
+        self._entropies = {}
+
+        meta = None
+        if root is not None:
+            os.makedirs(root, exist_ok=True)
+            meta = self._read_json(self.meta_path)
+        if meta is not None and seed is None:
+            seed = np.random.SeedSequence(meta['entropy'], spawn_key=tuple(meta['spawn_key']))
+        seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.entropy = seed_sequence.entropy
+        self.spawn_key = tuple(seed_sequence.spawn_key)
+
+        if root is not None:
+            if meta is None:
+                meta = self._create_meta()
+            assert meta['sample_num'] == sample_num and meta['dtype'] == self.dtype.str, \
+                'The bank in {} holds {} samples of dtype {}'.format(root, meta['sample_num'], meta['dtype'])
+            assert self.entropy == meta['entropy'] and self.spawn_key == tuple(meta['spawn_key']), \
+                'The bank in {} was drawn with another seed'.format(root)
+            for name in os.listdir(root):
+                key, extension = os.path.splitext(name)
+                if extension == '.json' and name != 'bank.json' and os.path.exists(self._path(key)):
+                    self.seeds[key] = self._read_json(os.path.join(root, name))['seed']
+
+    @property
+    def meta_path(self):
+        return os.path.join(self.root, 'bank.json')
+
+    @staticmethod
+    def _read_json(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_json(self, path, content, replace=True):
+        # write a temporary file and rename it into place, readers never see a partial file;
+        # without replace, the file is linked into place only if it does not exist yet
+        fd, temporary_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(content, f, indent=1, sort_keys=True)
+        if replace:
+            os.replace(temporary_path, path)
+            return
+        try:
+            os.link(temporary_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temporary_path)
+
+    def _create_meta(self):
+        # the first of concurrent openers of a new root records its seed, the others check against it
+        self._write_json(self.meta_path, {'sample_num': self.sample_num, 'dtype': self.dtype.str,
+                                          'entropy': self.entropy, 'spawn_key': list(self.spawn_key)}, replace=False)
+        return self._read_json(self.meta_path)
+
+    def _path(self, key):
+        return os.path.join(self.root, key + '.npy')
+
+    def __contains__(self, key):
+        return key in self._samples or (self.root is not None and os.path.exists(self._path(key)))
+
+    def __getstate__(self):
+        # worker processes rebuild the distance cache, and memory-map the samples of a root again;
+        # without a root every sample is pickled, see subset
+        state = dict(self.__dict__)
+        state['_distances'] = OrderedDict()
+        if self.root is not None:
+            state['_samples'] = {}
+        return state
+
+    def subset(self, keys):
+        """
+        Input:
+        keys: keys of samples in the bank
+
+        Output:
+        a bank with the same seed and root holding the samples of keys only, e.g. to
+        send to worker processes the samples their tasks use instead of the bank
+        """
+        keys = set(keys)
+        bank = copy.copy(self)
+        bank.seeds = {key: seed for key, seed in self.seeds.items() if key in keys}
+        bank._samples = {key: samples for key, samples in self._samples.items() if key in keys}
+        bank._distances = OrderedDict((key, distances) for key, distances in self._distances.items() if key in keys)
+        bank._entropies = {cache_key: h for cache_key, h in self._entropies.items() if set(cache_key[0]) <= keys}
+        return bank
+
+    def add(self, sigma, replica=0):
+        """
+        Draw the samples of a network, unless the bank already has them.
+
+        Input:
+        sigma: the covariance matrix Sigma of the network, or its EncodedNetwork
+        replica: the index of an independent set of samples of the same network
+
+        Output:
+        key: the key of the samples in the bank
+        """
+        network = as_encoded_network(sigma)
+        assert not network.is_sparse, 'Sampling needs the dense Cholesky factor of Sigma'
+        digest = content_hash(network.sigma)
+        key = digest if replica == 0 else '{}.{}'.format(digest, replica)
+        if key in self:
+            return key
+
+        seed_sequence = np.random.SeedSequence(self.entropy, spawn_key=self.spawn_key + (int(digest[:16], 16), replica))
+        rng = np.random.default_rng(seed_sequence)
+        shape = (network.shape[0], self.sample_num)
+        self.seeds[key] = {'entropy': seed_sequence.entropy, 'spawn_key': list(seed_sequence.spawn_key)}
+        if self.root is None:
+            self._samples[key] = default_sampler.sample(network, self.sample_num, rng, dtype=self.dtype)
+            return key
+
+        # the entry goes first, a network is in the bank once its samples are; another
+        # process may draw the same samples, both files are replaced atomically
+        self._write_json(os.path.join(self.root, key + '.json'), {'seed': self.seeds[key], 'n': shape[0]})
+        fd, path = tempfile.mkstemp(dir=self.root, suffix='.npy')
+        os.close(fd)
+        samples = np.lib.format.open_memmap(path, mode='w+', dtype=self.dtype, shape=shape)
+        default_sampler.sample(network, self.sample_num, rng, out=samples)
+        samples.flush()
+        del samples
+        os.replace(path, self._path(key))
+        return key
+
+    def add_pair(self, sigma_a, sigma_b):
+        """
+        Output:
+        key_a, key_b: the keys of the samples of networks a and b; if they are the
+            same network, b gets an independent replica of the samples
+        """
+        key_a = self.add(sigma_a)
+        key_b = self.add(sigma_b)
+        if key_b == key_a:
+            key_b = self.add(sigma_b, replica=1)
+        return key_a, key_b
+
+    def samples(self, key):
+        """
+        Output:
+        the n x sample_num samples of the network key
+        """
+        if key not in self._samples:
+            if self.root is None or not os.path.exists(self._path(key)):
+                raise KeyError('No samples of {} in the bank, add the network first'.format(key))
+            self._samples[key] = np.load(self._path(key), mmap_mode='r')
+        return self._samples[key]
+
+    def distances(self, key):
+        """
+        Output:
+        the sample_num x sample_num Chebyshev distances between the samples of the
+        network key, or None if they do not fit in max_distance_bytes
+        """
+        if key in self._distances:
+            self._distances.move_to_end(key)
+            return self._distances[key]
+        if 8 * self.sample_num ** 2 > self.max_distance_bytes:
+            return None
+        points = self.samples(key).T
+        with span('knn_query', n=self.sample_num, dim=points.shape[1], method='sample_bank_distances'):
+            distances = cdist(points, points, 'chebyshev')
+        self._distances[key] = distances
+        while 8 * self.sample_num ** 2 * len(self._distances) > self.max_distance_bytes:
+            self._distances.popitem(last=False)
+        return distances
+
+    def joint_entropy(self, parts, k, method='knn', **options):
+        """
+        entropy of the joint samples of several networks of the bank
+
+        Input:
+        parts: a list of keys, or of (key, index) pairs for the sub-block index of
+            the network key, whose samples are the rows index of its samples
+        k: the number of nearest neighbors in KNN-based entropy estimation
+        method: the entropy estimator, see entropy_estimation; 'knn' without
+            options and 'chunked_chebyshev' with at most a max_memory option use the
+            Chebyshev distances of the bank, with max_memory bounding the distance
+            blocks; any other method or option runs the estimator itself on the
+            samples of the bank
+        options: keyword arguments of the entropy estimator
+
+        Output:
+        h: the entropy estimate, cached if parts are whole networks
+        """
+        parts = [(part, None) if isinstance(part, str) else part for part in parts]
+        cache_key = None
+        if all(index is None for _, index in parts):
+            cache_key = (tuple(key for key, _ in parts), k, method, repr(sorted(options.items())))
+            if cache_key in self._entropies:
+                return self._entropies[cache_key]
+
+        blocks = [self.samples(key) if index is None else self.samples(key)[index] for key, index in parts]
+        if self._uses_distances(method, options):
+            h = self._chebyshev_entropy(parts, blocks, k, options.get('max_memory', 2**28))
+        else:
+            h = entropy_estimation(np.concatenate(blocks).T, k, method, **options)
+        if cache_key is not None:
+            self._entropies[cache_key] = h
+        return h
+
+    @staticmethod
+    def _uses_distances(method, options):
+        # the cached distances give the radii of both Chebyshev estimators, but not
+        # their other options (threads, dtype, tree parameters), which are passed on
+        if method == 'knn':
+            return not options
+        return method == 'chunked_chebyshev' and set(options) <= {'max_memory'}
+
+    def _chebyshev_entropy(self, parts, blocks, k, max_memory):
+        dim = sum(block.shape[0] for block in blocks)
+        sources = []
+        for (key, index), block in zip(parts, blocks):
+            distances = self.distances(key) if index is None else None
+            sources.append((None if distances is not None else np.ascontiguousarray(block.T), distances))
+
+        # every block of rows holds the maximum and one computed distance block at a time
+        chunk = max(1, int(max_memory // (16 * self.sample_num)))
+        r = np.empty(self.sample_num)
+        with span('knn_query', n=self.sample_num, dim=dim, k=k, method='sample_bank'):
+            for start in range(0, self.sample_num, chunk):
+                stop = min(start + chunk, self.sample_num)
+                joint = None
+                for points, distances in sources:
+                    block = distances[start:stop] if points is None else cdist(points[start:stop], points, 'chebyshev')
+                    if joint is None:
+                        joint = block.copy() if points is None else block
+                    else:
+                        np.maximum(joint, block, out=joint)
+                joint.partition(k-1, axis=1)
+                r[start:stop] = joint[:, k-1]
+        return knn_entropy_from_radius(r, self.sample_num, dim, k)
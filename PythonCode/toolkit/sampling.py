@@ -0,0 +1,114 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from .encoded_network import EncodedNetwork
+from .profiling import span
+
+
+def content_hash(matrix):
+    """
+    Input:
+    matrix: a numpy array
+
+    Output:
+    a hex digest of the shape, dtype and content of the matrix
+    """
+    matrix = np.ascontiguousarray(matrix)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str((matrix.shape, matrix.dtype.str)).encode())
+    digest.update(matrix.data)
+    return digest.hexdigest()
+
+
+class GaussianSampler(object):
+    """
+    Multivariate Gaussian sampler that factorizes every covariance matrix once.
+    Factors of EncodedNetworks are their own cached Cholesky factors, factors of
+    plain matrices are kept in a small LRU cache keyed by a content hash. Samples
+    of a sub-block Sigma[index][:, index] are the rows index of samples of Sigma,
+    i.e. they use the rows index of the factor of Sigma instead of a new
+    factorization. Samples are generated in blocks of block_size columns, so
+    besides the output only one block of standard normal noise is allocated.
+
+    Input:
+    block_size: the number of samples generated per block
+    dtype: the dtype of the generated samples, e.g. np.float32 to halve the memory
+    max_cached: the number of factors of plain matrices kept in the cache
+    """
+
+    def __init__(self, block_size=4096, dtype=np.float64, max_cached=8):
+        self.block_size = block_size
+        self.dtype = np.dtype(dtype)
+        self.max_cached = max_cached
+        self._factors = OrderedDict()
+
+    def factor(self, sigma):
+        """
+        Input:
+        sigma: the covariance matrix, m x m, or an EncodedNetwork
+
+        Output:
+        the lower Cholesky factor of sigma
+        """
+        if isinstance(sigma, EncodedNetwork):
+            return sigma.cholesky
+        key = content_hash(sigma)
+        if key in self._factors:
+            self._factors.move_to_end(key)
+            return self._factors[key]
+
+        assert sigma.shape[0] == sigma.shape[1], 'The covariance matrix is not square'
+        assert np.linalg.norm(sigma - sigma.T) < 1e-8, 'The covariance matrix is not symmetric, norm: {}'.format(np.linalg.norm(sigma - sigma.T))
+        with span('cholesky', n=sigma.shape[0]):
+            try:
+                factor = np.linalg.cholesky(sigma)
+            except np.linalg.LinAlgError:
+                factor = np.linalg.cholesky(sigma + np.eye(sigma.shape[0]) * 1e-8)
+        self._factors[key] = factor
+        if len(self._factors) > self.max_cached:
+            self._factors.popitem(last=False)
+        return factor
+
+    def sample(self, sigma, n, rng=None, index=None, mu=None, out=None, dtype=None):
+        """
+        Input:
+        sigma: the covariance matrix, m x m, or an EncodedNetwork
+        n: the number of samples
+        rng: a numpy.random.Generator, the global numpy random state is used if None
+        index: the nodes of the sub-block to sample, all nodes if None
+        mu: the mean vector, zero if None
+        out: a preallocated len(index) x n output matrix, e.g. a block of rows of a
+            larger matrix, whose dtype is then used
+        dtype: the dtype of the samples, self.dtype if None
+
+        Output:
+        y: the generated samples, len(index) x n
+        """
+        dtype = self.dtype if dtype is None else np.dtype(dtype)
+        if out is not None:
+            dtype = out.dtype
+        factor = self.factor(sigma)
+        if index is not None:
+            factor = factor[index]
+        if factor.dtype != dtype:
+            factor = factor.astype(dtype)
+        m, full_dim = factor.shape
+        if out is None:
+            out = np.empty((m, n), dtype=dtype)
+
+        with span('sampling', dim=m, n=n, bytes=out.nbytes):
+            for start in range(0, n, self.block_size):
+                size = min(self.block_size, n - start)
+                if rng is None:
+                    z = np.random.standard_normal((full_dim, size)).astype(dtype, copy=False)
+                else:
+                    z = rng.standard_normal((full_dim, size), dtype=dtype)
+                np.matmul(factor, z, out=out[:, start:start+size])
+            if mu is not None:
+                out += np.asarray(mu, dtype=dtype).reshape(-1, 1)
+        return out
+
+
+default_sampler = GaussianSampler()
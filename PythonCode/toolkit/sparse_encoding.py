@@ -0,0 +1,201 @@
+from functools import cached_property
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import LinearOperator, splu, cg
+
+from .profiling import span
+
+
+class GroundedLaplacianSolver(object):
+    """
+    Sparse LU factorization of a connected, symmetric graph Laplacian with its
+    first node grounded. L[1:, 1:] is nonsingular, so L^+ b is obtained from one
+    sparse solve on the centered right-hand side, and by the matrix-tree theorem
+    the product of the nonzero eigenvalues of L is n * det(L[1:, 1:]).
+
+    Networks whose factorization fills in badly (e.g. random expanders) can use
+    method='cg' instead, which solves with Jacobi-preconditioned conjugate
+    gradients in O(m) memory but cannot provide the log-determinant.
+
+    Input:
+    L: the sparse graph Laplacian of a connected network
+    method: 'direct' for a sparse LU factorization, 'cg' for conjugate gradients
+    tol: the relative tolerance of the conjugate gradient solves
+    """
+
+    def __init__(self, L, method='direct', tol=1e-10):
+        assert method in ('direct', 'cg'), 'Unknown solver method: {}'.format(method)
+        self.n = L.shape[0]
+        self.L = L
+        self.method = method
+        self.tol = tol
+
+    @cached_property
+    def lu(self):
+        with span('sparse_lu', n=self.n, nnz=self.L.nnz):
+            lu = splu(sp.csc_matrix(self.L[1:, 1:]), permc_spec='MMD_AT_PLUS_A',
+                      options=dict(SymmetricMode=True))
+        return lu
+
+    def pinv_solve(self, b):
+        """
+        Input:
+        b: n or n*k right-hand side
+
+        Output:
+        x: L^+ b
+        """
+        b = b - np.mean(b, axis=0)
+        x = np.zeros(b.shape)
+        lu = self.lu if self.method == 'direct' else None
+        with span('sparse_solve', n=self.n, columns=b.size // self.n, method=self.method):
+            if lu is None:
+                columns = x.reshape(self.n, -1)
+                for j, column in enumerate(b.reshape(self.n, -1).T):
+                    columns[:, j], info = cg(self.L, column, rtol=self.tol, M=self.jacobi)
+                    assert info == 0, 'The conjugate gradient solve did not converge'
+            else:
+                x[1:] = lu.solve(np.ascontiguousarray(b[1:]))
+        return x - np.mean(x, axis=0)
+
+    @cached_property
+    def jacobi(self):
+        d = self.L.diagonal()
+        d[d == 0] = 1.0
+        return sp.diags(1.0 / d)
+
+    @cached_property
+    def logdet_nonzero(self):
+        """
+        the sum of the logarithms of the nonzero eigenvalues of L
+        """
+        assert self.method == 'direct', 'The log-determinant needs the direct solver'
+        return np.log(self.n) + np.sum(np.log(np.abs(self.lu.U.diagonal())))
+
+
+class SparsePseudoinverse(LinearOperator):
+    """
+    The Moore-Penrose pseudoinverse of a sparse graph Laplacian, applied
+    through a sparse factorization instead of being materialized.
+
+    Input:
+    L: the sparse graph Laplacian of a connected network
+    solver: an existing GroundedLaplacianSolver of L to share
+    """
+
+    def __init__(self, L, solver=None):
+        super().__init__(dtype=np.float64, shape=L.shape)
+        self.L = L
+        self.solver = GroundedLaplacianSolver(L) if solver is None else solver
+
+    def _matvec(self, x):
+        return self.solver.pinv_solve(x.reshape(-1))
+
+    def _matmat(self, X):
+        return self.solver.pinv_solve(X)
+
+    def _adjoint(self):
+        return self
+
+
+class SparseSigma(LinearOperator):
+    """
+    The covariance matrix Sigma of a sparse network, kept as the sparse Laplacian
+    (or its pseudoinverse) plus the rank-one term J/n without materializing it.
+    For a connected network, inv(L + J/n) = L^+ + J/n, so both choices of Sigma
+    are applied and inverted with the same grounded factorization.
+
+    Input:
+    L: the sparse graph Laplacian of a connected network
+    take_pseudoinverse: whether Sigma is built from the pseudoinverse of L
+    solver: an existing GroundedLaplacianSolver of L to share
+    """
+
+    def __init__(self, L, take_pseudoinverse=False, solver=None):
+        super().__init__(dtype=np.float64, shape=L.shape)
+        self.L = L
+        self.take_pseudoinverse = take_pseudoinverse
+        self.solver = GroundedLaplacianSolver(L) if solver is None else solver
+
+    def _apply_laplacian(self, X):
+        return self.L @ X + np.mean(X, axis=0)
+
+    def _apply_pseudoinverse(self, X):
+        return self.solver.pinv_solve(X) + np.mean(X, axis=0)
+
+    def _matvec(self, x):
+        return self._matmat(x.reshape(-1, 1)).reshape(-1)
+
+    def _matmat(self, X):
+        if self.take_pseudoinverse:
+            return self._apply_pseudoinverse(X)
+        return self._apply_laplacian(X)
+
+    def _adjoint(self):
+        return self
+
+    def solve(self, b):
+        """
+        Input:
+        b: n or n*k right-hand side
+
+        Output:
+        x: inv(Sigma) b
+        """
+        if self.take_pseudoinverse:
+            return self._apply_laplacian(b)
+        return self._apply_pseudoinverse(b)
+
+    def logdet(self):
+        if self.take_pseudoinverse:
+            return -self.solver.logdet_nonzero
+        return self.solver.logdet_nonzero
+
+    def toarray(self):
+        return self._matmat(np.eye(self.shape[0]))
+
+
+def sparse_graph_laplacian(W, graph_type='undirected', normalize=False):
+    """
+    Input:
+    W: the sparse weighted adjacent matrix
+    type: the type of the graph Laplacian, 'undirected' or 'directed_in' or 'directed_out' or 'directed_symmetric'
+
+    Output:
+    L: the sparse graph Laplacian in CSR format
+    """
+    assert not normalize, 'The normalized Laplacian is not supported for sparse networks'
+    W = sp.csr_matrix(W, dtype=np.float64)
+    if graph_type == 'directed_in':
+        W = W.T.tocsr()
+    elif graph_type == 'directed_symmetric':
+        W = (W + W.T).tocsr()
+    if W.nnz:
+        assert abs(W - W.T).max() < 1e-8, \
+            'The sparse encoding needs a symmetric Laplacian, use graph_type=\'directed_symmetric\''
+    d = np.asarray(W.sum(axis=1)).ravel()
+    return (sp.diags(d) - W).tocsr()
+
+
+def trace_of_solve(sigma_b, sigma_a, block_size=256):
+    """
+    compute tr(inv(sigma_b) * sigma_a) exactly, one block of columns at a time
+
+    Input:
+    sigma_b: an object with a solve method, e.g. SparseSigma or EncodedNetwork
+    sigma_a: a matrix or LinearOperator
+    block_size: the number of columns solved together
+
+    Output:
+    trace: tr(inv(sigma_b) * sigma_a)
+    """
+    n = sigma_a.shape[0]
+    trace = 0.0
+    for start in range(0, n, block_size):
+        columns = np.arange(start, min(start + block_size, n))
+        E = np.zeros((n, columns.shape[0]))
+        E[columns, np.arange(columns.shape[0])] = 1.0
+        X = sigma_b.solve(np.asarray(sigma_a @ E))
+        trace += np.sum(X[columns, np.arange(columns.shape[0])])
+    return trace
@@ -0,0 +1,172 @@
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.linalg import eigh_tridiagonal
+from scipy.sparse.linalg import aslinearoperator, cg
+
+from .encoded_network import as_encoded_network
+from .profiling import span
+
+
+def _operator(network):
+    return aslinearoperator(network.sigma)
+
+
+def _jacobi(network):
+    # the diagonal of Sigma = L + J/n is known without applying Sigma
+    n = network.shape[0]
+    if network.is_sparse and not network.take_pseudoinverse:
+        d = network.L.diagonal() + 1.0 / n
+    elif not network.is_sparse:
+        d = np.diag(network.sigma).copy()
+    else:
+        return None
+    d[d <= 0] = 1.0
+    return sp.diags(1.0 / d)
+
+
+def _inverse_matvec(network, cg_tol):
+    """
+    Output:
+    a function x -> inv(Sigma) x using only products with sparse matrices or Sigma
+    """
+    if network.is_sparse and network.take_pseudoinverse:
+        # inv(L^+ + J/n) = L + J/n
+        L = network.L
+        return lambda x: L @ x + np.mean(x)
+    A = _operator(network)
+    M = _jacobi(network)
+
+    def solve(x):
+        y, info = cg(A, x, rtol=cg_tol, M=M)
+        assert info == 0, 'The conjugate gradient solve did not converge'
+        return y
+    return solve
+
+
+def _rademacher(n, rng):
+    return rng.integers(0, 2, n).astype(np.float64) * 2 - 1
+
+
+def lanczos_quadrature(matvec, v, steps, func=np.log):
+    """
+    Gauss quadrature of v' * func(A) * v from a Lanczos tridiagonalization of A
+    started at v, with full reorthogonalization.
+
+    Input:
+    matvec: a function x -> A x of a symmetric positive definite A
+    v: the starting vector
+    steps: the maximal number of Lanczos steps
+    func: the function of the eigenvalues
+
+    Output:
+    the estimate of v' * func(A) * v
+    """
+    norm = np.linalg.norm(v)
+    # the Krylov space has at most n dimensions
+    steps = min(steps, v.shape[0])
+    Q = np.zeros((v.shape[0], steps))
+    alpha = np.zeros(steps)
+    beta = np.zeros(steps)
+    q = v / norm
+    m = steps
+    for i in range(steps):
+        Q[:, i] = q
+        w = matvec(q)
+        alpha[i] = np.dot(q, w)
+        # two Gram-Schmidt passes: one loses orthogonality by a factor |alpha|/beta per step
+        w -= Q[:, :i+1] @ (Q[:, :i+1].T @ w)
+        w -= Q[:, :i+1] @ (Q[:, :i+1].T @ w)
+        beta[i] = np.linalg.norm(w)
+        if beta[i] < 1e-12 * abs(alpha[i]):
+            m = i + 1
+            break
+        q = w / beta[i]
+    theta, S = eigh_tridiagonal(alpha[:m], beta[:m-1])
+    return norm**2 * np.sum(S[0]**2 * func(theta))
+
+
+class _ProbeMean(object):
+    # running mean and standard error of per-probe estimates
+
+    def __init__(self):
+        self.values = []
+
+    def add(self, value):
+        self.values.append(value)
+
+    @property
+    def mean(self):
+        return np.mean(self.values)
+
+    @property
+    def error(self):
+        if len(self.values) < 2:
+            return np.inf
+        return np.std(self.values, ddof=1) / np.sqrt(len(self.values))
+
+
+def stochastic_infomation_divergence(sigma_a, sigma_b, probe_num=64, lanczos_steps=32, tol=None,
+                                     time_budget=None, cg_tol=1e-8, seed=None):
+    """
+    Approximate information divergence through products with Sigma only, for
+    networks too large for a dense factorization: tr(inv(Sigma_b)*Sigma_a) is
+    estimated with Hutchinson's Rademacher probes and conjugate gradient solves,
+    and the log-determinants with stochastic Lanczos quadrature.
+
+    Probes are drawn until probe_num is reached, or the standard errors of both
+    divergences are below tol relative to their values, or time_budget seconds
+    have passed, whichever comes first; at least 2 probes are always drawn. The
+    standard errors cover the probe variance, not the Lanczos truncation, which
+    is small once lanczos_steps exceeds a few tens for well-conditioned Sigma.
+
+    Input:
+    sigma_a: the covariance matrix Sigma of network a, a SparseSigma, or an
+        EncodedNetwork, preferably of a sparse W with sparse_solver='cg'
+    sigma_b: the covariance matrix Sigma of network b, as sigma_a
+    probe_num: the maximal number of probes per estimate
+    lanczos_steps: the number of Lanczos steps per log-determinant probe
+    tol: the target relative standard error, None to use all probes
+    time_budget: the maximal time in seconds, None for no limit
+    cg_tol: the relative tolerance of the conjugate gradient solves
+    seed: None, an int, a SeedSequence or a numpy.random.Generator
+
+    Output:
+    d_ab: the estimated information divergence from a to b
+    d_ba: the estimated information divergence from b to a
+    d_ab_error: the standard error of d_ab
+    d_ba_error: the standard error of d_ba
+    """
+
+    network_a = as_encoded_network(sigma_a)
+    network_b = as_encoded_network(sigma_b)
+    n = network_a.shape[0]
+    assert network_b.shape[0] == n, 'The networks need the same size, use network_approximation first'
+    rng = np.random.default_rng(seed)
+
+    A, B = _operator(network_a), _operator(network_b)
+    solve_a, solve_b = _inverse_matvec(network_a, cg_tol), _inverse_matvec(network_b, cg_tol)
+    d_ab, d_ba = _ProbeMean(), _ProbeMean()
+
+    # every probe z gives one unbiased estimate of each divergence,
+    # 0.5*(z'*inv(Sigma_b)*Sigma_a*z - n + z'*log(Sigma_b)*z - z'*log(Sigma_a)*z); using the
+    # same z for all the terms lets their fluctuations cancel out in the differences
+    start = time.perf_counter()
+    with span('stochastic_divergence', n=n, probe_num=probe_num, lanczos_steps=lanczos_steps):
+        for probe in range(probe_num):
+            z = _rademacher(n, rng)
+            trace_ab = np.dot(z, solve_b(A.matvec(z)))
+            trace_ba = np.dot(z, solve_a(B.matvec(z)))
+            logdet_a = lanczos_quadrature(A.matvec, z, lanczos_steps)
+            logdet_b = lanczos_quadrature(B.matvec, z, lanczos_steps)
+            d_ab.add(0.5*(trace_ab - n + logdet_b - logdet_a))
+            d_ba.add(0.5*(trace_ba - n + logdet_a - logdet_b))
+            if probe < 1:
+                continue
+            if tol is not None and all(d.error <= tol * abs(d.mean) for d in (d_ab, d_ba)):
+                break
+            if time_budget is not None and time.perf_counter() - start > time_budget:
+                break
+
+    return d_ab.mean, d_ba.mean, d_ab.error, d_ba.error
@@ -0,0 +1,182 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+
+import numpy as np
+import scipy.sparse as sp
+
+from .encoded_network import EncodedNetwork
+
+
+DENSE_ARRAYS = ('L', 'PinvL', 'sigma', 'cholesky', 'inv', 'eigvals')
+# names are directories of the root, they cannot hold a separator or start with a dot
+NAME_PATTERN = re.compile(r'[A-Za-z0-9_-][A-Za-z0-9_.-]*')
+
+
+class NetworkStore(object):
+    """
+    On-disk store of networks and their encodings. Every array is a .npy file,
+    sparse matrices are kept as their CSR data, indices and indptr arrays, and an
+    entry.json file in the directory of every network records what is stored.
+    Arrays are loaded as read-only memory maps, so processes that open the same
+    store share one copy of the data through the page cache instead of receiving
+    pickled matrices.
+
+    Every file is written to a temporary file and renamed into place, and every
+    network has its own entry file, so processes can put networks concurrently
+    without a lock and readers never see a partial file. Concurrent puts of the
+    same name should store the same network, as the content-hashed uploads of
+    the service do, since their files may otherwise come from either put.
+
+    Names are made of letters, digits, '_', '-' and '.', and do not start with a
+    dot, so that they stay inside the root; other names raise a ValueError.
+
+    Input:
+    root: the directory of the store, created if needed
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def _check_name(name):
+        if not isinstance(name, str) or NAME_PATTERN.fullmatch(name) is None:
+            raise ValueError('Invalid network name {!r}, names match {}'.format(name, NAME_PATTERN.pattern))
+        return name
+
+    def _entry_path(self, name):
+        return os.path.join(self.root, self._check_name(name), 'entry.json')
+
+    def _read_entry(self, name):
+        try:
+            with open(self._entry_path(name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise KeyError(name)
+
+    def _write_entry(self, name, entry):
+        # replace the entry atomically, readers never see a partial file
+        fd, path = tempfile.mkstemp(dir=os.path.join(self.root, name), suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f, indent=1, sort_keys=True)
+        os.replace(path, self._entry_path(name))
+
+    def names(self):
+        return sorted(name for name in os.listdir(self.root)
+                      if NAME_PATTERN.fullmatch(name) and os.path.exists(self._entry_path(name)))
+
+    def __contains__(self, name):
+        return os.path.exists(self._entry_path(name))
+
+    def _save_array(self, name, key, array):
+        # memory maps of the previous array keep its file, which the rename only unlinks
+        path = os.path.join(name, key + '.npy')
+        fd, temporary_path = tempfile.mkstemp(dir=os.path.join(self.root, name), suffix='.npy')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, np.asarray(array))
+        os.replace(temporary_path, os.path.join(self.root, path))
+        return path
+
+    def _save_matrix(self, name, key, matrix):
+        if sp.issparse(matrix):
+            matrix = sp.csr_matrix(matrix)
+            return {
+                'format': 'csr',
+                'shape': list(matrix.shape),
+                'data': self._save_array(name, key + '.data', matrix.data),
+                'indices': self._save_array(name, key + '.indices', matrix.indices),
+                'indptr': self._save_array(name, key + '.indptr', matrix.indptr),
+            }
+        return {'format': 'dense', 'data': self._save_array(name, key, matrix)}
+
+    def _load_array(self, path, mmap):
+        return np.load(os.path.join(self.root, path), mmap_mode='r' if mmap else None)
+
+    def _load_matrix(self, entry, mmap):
+        if entry['format'] == 'csr':
+            # scipy.sparse keeps the memory-mapped arrays as they are
+            return sp.csr_matrix((self._load_array(entry['data'], mmap), self._load_array(entry['indices'], mmap),
+                                  self._load_array(entry['indptr'], mmap)), shape=tuple(entry['shape']), copy=False)
+        return self._load_array(entry['data'], mmap)
+
+    def put(self, name, network, arrays=('sigma', 'cholesky', 'logdet')):
+        """
+        Store a network, computing the requested parts of its encoding if needed.
+
+        Input:
+        name: the name of the network in the store
+        network: an EncodedNetwork, or a weighted adjacent matrix to encode
+        arrays: the encoded quantities to store, among 'L', 'PinvL', 'sigma',
+            'cholesky', 'inv', 'eigvals' and 'logdet'; only 'L' and 'logdet' are
+            stored for sparse networks
+        """
+        if not isinstance(network, EncodedNetwork):
+            network = EncodedNetwork(network)
+        try:
+            previous = self._read_entry(name)
+        except KeyError:
+            previous = None
+        os.makedirs(os.path.join(self.root, name), exist_ok=True)
+        entry = {
+            'take_pseudoinverse': network.take_pseudoinverse,
+            'graph_type': network.graph_type,
+            'normalize': network.normalize,
+            'sparse': network.is_sparse,
+            'arrays': {},
+        }
+        if network.W is not None:
+            entry['arrays']['W'] = self._save_matrix(name, 'W', network.W)
+        for key in arrays:
+            if key == 'logdet':
+                entry['logdet'] = float(network.logdet)
+            elif network.is_sparse and key != 'L':
+                continue
+            else:
+                entry['arrays'][key] = self._save_matrix(name, key, getattr(network, key))
+
+        self._write_entry(name, entry)
+        if previous is not None:
+            # the arrays of the previous version that the new one does not have
+            for path in set(_array_paths(previous)) - set(_array_paths(entry)):
+                try:
+                    os.remove(os.path.join(self.root, path))
+                except FileNotFoundError:
+                    pass
+
+    def get(self, name, mmap=True):
+        """
+        Input:
+        name: the name of the network in the store
+        mmap: whether to memory-map the arrays instead of reading them into memory
+
+        Output:
+        network: an EncodedNetwork whose stored quantities are already cached
+        """
+        entry = self._read_entry(name)
+        arrays = entry['arrays']
+        W = self._load_matrix(arrays['W'], mmap) if 'W' in arrays else None
+        network = EncodedNetwork(W, entry['take_pseudoinverse'], entry['graph_type'], entry['normalize'])
+        for key, matrix in arrays.items():
+            if key in DENSE_ARRAYS:
+                network.__dict__[key] = self._load_matrix(matrix, mmap)
+        if 'logdet' in entry:
+            network.__dict__['logdet'] = entry['logdet']
+        if W is None and 'sigma' not in network.__dict__:
+            raise KeyError('Network {} has neither W nor sigma stored'.format(name))
+        return network
+
+    def remove(self, name):
+        if name not in self:
+            raise KeyError(name)
+        os.remove(self._entry_path(name))
+        shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+
+def _array_paths(entry):
+    for matrix in entry['arrays'].values():
+        for part in ('data', 'indices', 'indptr'):
+            if part in matrix:
+                yield matrix[part]
@@ -1,24 +1,86 @@
 import numpy as np
-from sklearn.neighbors import NearestNeighbors
-from scipy.special import psi
+import scipy.linalg
+import scipy.sparse as sp
 
+from .sparse_encoding import SparsePseudoinverse, SparseSigma, sparse_graph_laplacian
+from .entropy_estimators import get_entropy_estimator
+from .profiling import span
 
-def pseudoinverse(L):
+
+def pseudoinverse(L, out=None):
     """
     Input:
-    L: the graph Laplacian
+    L: the graph Laplacian, or a b*n*n stack of graph Laplacians
+    out: a preallocated n*n float array for the result, which may be L itself to
+        invert in place
 
     Output:
-    PinvL: the Moore-Penrose pseudoinverse of L
+    PinvL: the Moore-Penrose pseudoinverse of L, a SparsePseudoinverse operator if L is sparse
     """
-    PinvL = np.linalg.inv(L + np.ones(L.shape) / L.shape[0]) - np.ones(L.shape) / L.shape[0]  
+    if sp.issparse(L):
+        return SparsePseudoinverse(L)
+    n = L.shape[-1]
+    if L.ndim == 3:
+        # one batched LAPACK call for the whole stack
+        with span('pseudoinverse', n=n, batch=L.shape[0]):
+            A = np.add(L, 1.0 / n, out=out)
+            PinvL = np.linalg.inv(A)
+            del A
+            PinvL -= 1.0 / n
+        return PinvL
+    with span('pseudoinverse', n=n):
+        # PinvL = inv(L + J/n) - J/n; J/n is broadcast as a scalar, and inverting the
+        # transposed (Fortran-ordered) view lets LAPACK overwrite the buffer in place
+        A = np.add(L, 1.0 / n, out=out)
+        PinvL = scipy.linalg.inv(A.T, overwrite_a=True, check_finite=False).T
+        PinvL -= 1.0 / n
     return PinvL
 
 
+def graph_laplacian(W, graph_type='undirected', normalize=False, out=None):
+    """
+    Input:
+    W: the weighted adjacent matrix, or a b*n*n stack of weighted adjacent matrices
+    type: the type of the graph Laplacian, 'undirected' or 'directed_in' or 'directed_out' or 'directed_symmetric'
+    normalize: whether to use the random-walk normalized Laplacian
+    out: a preallocated array of the shape of W for the unnormalized dense Laplacian,
+        which may be W itself to build L in place
+
+    Output:
+    L: the graph Laplacian
+    """
+    with span('graph_laplacian', n=W.shape[-1], sparse=sp.issparse(W), graph_type=graph_type):
+        if sp.issparse(W):
+            return sparse_graph_laplacian(W, graph_type, normalize)
+        # the last two axes are the matrix axes, so a stack of W is handled at once
+        if graph_type == 'directed_in':
+            W = np.swapaxes(W, -1, -2)
+        elif graph_type == 'directed_symmetric':
+            W = W + np.swapaxes(W, -1, -2)
+        d = np.sum(W, axis=-1)
+        if normalize:
+            d_zeros = d == 0
+            d[d_zeros] = 1.0
+            P = W / d[..., np.newaxis, :]
+            P[d_zeros] = 1.0
+            L = np.eye(W.shape[-1]) - P
+        else:
+            # L = D - W without materializing D; boolean and integer W give a float64 L
+            if out is not None:
+                dtype = out.dtype
+            else:
+                dtype = W.dtype if np.issubdtype(W.dtype, np.floating) else np.float64
+            L = np.negative(W, out=out, dtype=dtype)
+            diagonal = np.einsum('...ii->...i', L)
+            diagonal += d
+        return L
+
+
 def generate_random_variable(W, take_pseudoinverse=False, graph_type='undirected', normalize=False):
     """
     Input: 
-    W: the weighted adjacent matrix
+    W: the weighted adjacent matrix, or a b*n*n stack of weighted adjacent matrices
+        whose encodings are computed together with batched LAPACK calls
     take_psuedoinverse: whether to take the pseudoinverse of the graph Laplacian
     type: the type of the graph Laplacian, 'undirected' or 'directed_in' or 'directed_out' or 'directed_symmetric'
 
@@ -26,30 +88,59 @@ def generate_random_variable(W, take_pseudoinverse=False, graph_type='undirected
     L: the graph Laplacian
     PinvL: the Moore-Penrose pseudoinverse of L 
     Sigma: the covariance matrix of Gaussian variable
+
+    If W is a scipy.sparse matrix of a connected network, L stays sparse, PinvL is a
+    SparsePseudoinverse operator and Sigma is a SparseSigma operator that keeps the
+    rank-one J/n term implicit, so the encoding needs O(m) memory plus the fill-in
+    of one sparse factorization.
     """
-    if graph_type == 'directed_in':
-        W = W.T
-    elif graph_type == 'directed_symmetric':
-        W = W + W.T
-    d = np.sum(W, axis=1)
-    if normalize:
-        d_zeros = np.where(d == 0)
-        d[d_zeros] = 1.0
-        P = W / d
-        P[d_zeros, :] = 1.0
-        L = np.eye(W.shape[0]) - P
-    else:
-        D = np.diag(d)
-        L = D - W
+    L = graph_laplacian(W, graph_type, normalize)
+    if sp.issparse(L):
+        PinvL = SparsePseudoinverse(L)
+        Sigma = SparseSigma(L, take_pseudoinverse, solver=PinvL.solver)
+        return L, PinvL, Sigma
     PinvL = pseudoinverse(L)
     if take_pseudoinverse:
-        Sigma = PinvL + np.ones(W.shape) / W.shape[0]
+        Sigma = PinvL + 1.0 / W.shape[-1]
     else:
-        Sigma = L + np.ones(W.shape) / W.shape[0]
+        Sigma = L + 1.0 / W.shape[-1]
     return L, PinvL, Sigma
 
 
-def multivar_gaussian_rand_num_generator(mu, sigma, n):
+def iter_sigma_ensemble(W_ensemble, chunk_size=16, take_pseudoinverse=False, graph_type='undirected',
+                        normalize=False):
+    """
+    Encode an ensemble of networks chunk by chunk, e.g. to stream an ensemble
+    larger than the memory into fisher_information.
+
+    Input:
+    W_ensemble: a x*n*n array or memory-mapped array of weighted adjacent matrices,
+        or any iterable of n*n weighted adjacent matrices, e.g. a generator
+    chunk_size: the number of networks encoded together with batched LAPACK calls
+    take_pseudoinverse, graph_type, normalize: see generate_random_variable
+
+    Output:
+    an iterator over the covariance matrices Sigma of the networks, in order; only
+    one chunk of encodings is held at a time, and the pseudoinverses are only
+    computed if take_pseudoinverse is True
+    """
+    W_ensemble = iter(W_ensemble)
+    while True:
+        chunk = [W for _, W in zip(range(chunk_size), W_ensemble)]
+        if not chunk:
+            return
+        L = graph_laplacian(np.array(chunk, dtype=np.float64), graph_type, normalize)
+        del chunk
+        if take_pseudoinverse:
+            sigma = pseudoinverse(L, out=L)
+        else:
+            sigma = L
+        sigma += 1.0 / sigma.shape[-1]
+        for i in range(sigma.shape[0]):
+            yield sigma[i]
+
+
+def multivar_gaussian_rand_num_generator(mu, sigma, n, rng=None):
     """
     y = mvg(mu,sigma,n), where mu is mx1 and Sigma is mxm and SPD, produces an mxN matrix y 
     whose columns are samples from the multivariate Gaussian distribution parameterized by 
@@ -58,43 +149,44 @@ def multivar_gaussian_rand_num_generator(mu, sigma, n):
     [y,R] = mvg(mu,sigma,n) also returns the Cholesky factor of the covariance matrix sigma 
     such that sigma = R'*R.
 
+    The Cholesky factor is cached by toolkit.sampling.default_sampler, so repeated
+    calls on the same covariance matrix only cost the matrix product.
+
     Input:
     mu: the mean vector, m x 1
-    sigma: the covariance matrix, m x m
+    sigma: the covariance matrix, m x m, or an EncodedNetwork whose cached Cholesky factor is reused
     n: the number of samples
+    rng: a numpy.random.Generator, the global numpy random state is used if None
 
     Output:
     y: the generated samples, m x n
     R: the Cholesky factor of the covariance matrix sigma
     """
+    from .sampling import default_sampler
+
     mu = mu.reshape(-1, 1)
     assert mu.shape[0] == sigma.shape[0], 'The mean vector and the covariance matrix do not have the same dimension'
     assert sigma.shape[0] == sigma.shape[1], 'The covariance matrix is not square'
-    assert np.linalg.norm(sigma - sigma.T) < 1e-8, 'The covariance matrix is not symmetric, norm: {}'.format(np.linalg.norm(sigma - sigma.T))
 
-    if np.min(np.linalg.eigvals(sigma)) < 0:
-        sigma = sigma + np.eye(sigma.shape[0]) * 1e-8
-    R = np.linalg.cholesky(sigma)
-    m = mu.shape[0]
-    y = np.matmul(R.T, np.random.randn(m, n)) + np.repeat(mu, n, axis=1)
+    R = default_sampler.factor(sigma).T
+    y = default_sampler.sample(sigma, n, rng, mu=mu)
     return y, R
 
 
-def entropy_estimation(joint_samples, k):
+def entropy_estimation(joint_samples, k, method='knn', **options):
     """
     Input:
-    sample_num: the number of samples in random sample generation
+    joint_samples: sample_num*dim matrix of samples
     k: the number of nearest neighbors in KNN-based entropy estimation
+    method: the name of a registered entropy estimator, 'knn' (sklearn, default),
+        'chunked_chebyshev' (chunked brute-force) or 'gaussian' (closed form)
+    options: keyword arguments of the estimator, e.g. algorithm or n_jobs
 
     Output:
     h: the entropy of the Gaussian variable
     """
 
-    nbrs = NearestNeighbors(n_neighbors=k, metric='chebyshev').fit(joint_samples)
-    distances, _ = nbrs.kneighbors(joint_samples)
-    r = np.max(distances, axis=1)
-    h = psi(joint_samples.shape[0]) + psi(k) + joint_samples.shape[1] * np.mean(np.log(r))
-    return h
+    return get_entropy_estimator(method)(joint_samples, k, **options)
 
 
 def convert_to_symmetric_with_zero_diagonal(mat):